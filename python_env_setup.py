@@ -17,15 +17,35 @@ The script will:
 6. Create a demo project folder in your home directory using pyenv-virtualenv.
 """
 
+import argparse
+import asyncio
+import bisect
+import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import json
+import math
 import os
 import platform
+import random
 import re
 import shutil
+import statistics
 import subprocess
 import sys
+import tarfile
+import tempfile
+import threading
+import time
 from pathlib import Path
 from textwrap import dedent
-from typing import List, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import contextvars
+except ImportError:  # Python 3.6
+    contextvars = None
 
 
 # Enforce a minimum Python version at runtime for clarity.
@@ -39,6 +59,410 @@ if sys.version_info < (3, 6):
     raise SystemExit(1)
 
 
+# ------------------------ tracing ------------------------
+
+
+class Span:
+    """A timed region of the run (a step or a command)."""
+
+    __slots__ = ("name", "cat", "start", "end", "parent", "lane", "args")
+
+    def __init__(self, name: str, cat: str, parent: Optional["Span"], args: dict) -> None:
+        self.name = name
+        self.cat = cat
+        self.start = time.monotonic()
+        self.end: Optional[float] = None
+        self.parent = parent
+        # Concurrent spans must not share a row in a timeline viewer, so each
+        # top-level span gets its own lane and its children inherit it.
+        self.lane = parent.lane if parent is not None else f"{name}#{id(self)}"
+        self.args = args
+
+
+class Tracer:
+    """Records spans for every step and command; exported with --trace."""
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self._counters: list = []
+        self._lock = threading.Lock()
+        self._t0 = time.monotonic()
+        if contextvars is not None:
+            self._current = contextvars.ContextVar("current_span", default=None)
+        else:  # Python 3.6: best effort, per thread
+            self._local = threading.local()
+
+    def current(self) -> Optional[Span]:
+        if contextvars is not None:
+            return self._current.get()
+        return getattr(self._local, "span", None)
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str = "step", **args):
+        """Time the enclosed block; yields the span's args dict for annotations."""
+
+        parent = self.current()
+        span = Span(name, cat, parent, args)
+        if parent is not None:
+            args.setdefault("parent", parent.name)
+        if contextvars is not None:
+            token = self._current.set(span)
+        else:
+            self._local.span = span
+        try:
+            yield args
+        finally:
+            span.end = time.monotonic()
+            if contextvars is not None:
+                self._current.reset(token)
+            else:
+                self._local.span = parent
+            with self._lock:
+                self.spans.append(span)
+
+    def counters(self, name: str, start: float, samples) -> None:
+        """Attach a time series (NamedTuples with a ``t`` offset field) to the trace."""
+
+        with self._lock:
+            self._counters.append((name, start, list(samples)))
+
+    def chrome_trace(self) -> dict:
+        """The recorded spans in Chrome trace-event format (complete "X" events)."""
+
+        pid = os.getpid()
+        lanes: Dict[str, int] = {}
+        events = []
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        for span in spans:
+            if span.lane not in lanes:
+                lanes[span.lane] = len(lanes) + 1
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": lanes[span.lane],
+                        "args": {"name": span.lane.split("#")[0]},
+                    }
+                )
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.cat,
+                    "ph": "X",
+                    "ts": round((span.start - self._t0) * 1e6),
+                    "dur": round(((span.end or span.start) - span.start) * 1e6),
+                    "pid": pid,
+                    "tid": lanes[span.lane],
+                    "args": {k: v for k, v in span.args.items() if v is not None},
+                }
+            )
+        with self._lock:
+            counters = list(self._counters)
+        for name, start, samples in counters:
+            for sample in samples:
+                values = sample._asdict()
+                ts = round((start + values.pop("t") - self._t0) * 1e6)
+                events.append({"name": name, "ph": "C", "ts": ts, "pid": pid, "args": values})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, indent=1)
+
+
+TRACER = Tracer()
+
+
+def traced(func):
+    """Record each call of func as a top-level step span."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with TRACER.span(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def in_current_context(func):
+    """Bind func to the caller's context so worker threads keep the span parent."""
+
+    if contextvars is None:
+        return func
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+def _command_span_name(cmd) -> str:
+    if isinstance(cmd, str):
+        return cmd.split()[0] if cmd.split() else cmd
+    parts = [str(c) for c in cmd]
+    if parts and parts[0] == "sudo":
+        parts = parts[1:]
+    return " ".join(parts[:2])
+
+
+def _command_text(cmd) -> str:
+    return cmd if isinstance(cmd, str) else " ".join(str(c) for c in cmd)
+
+
+# ------------------------ resource accounting ------------------------
+
+
+class ResourceUsage(NamedTuple):
+    """Resources used by a finished command and the descendants it waited for."""
+
+    wall: float
+    user: float
+    system: float
+    max_rss_mb: float
+
+
+class ProcSample(NamedTuple):
+    t: float
+    cpu_cores: float  # CPU time used by the command's process tree per wall second
+    rss_mb: float  # resident memory of the process tree
+    mem_available_mb: float  # host MemAvailable, or the cgroup's headroom when lower
+    mem_total_mb: float  # host MemTotal, or the cgroup's memory limit when lower
+    swap_used_mb: float
+    iowait_pct: float  # share of host CPU time spent waiting on I/O
+    io_read_mb: float  # cumulative bytes read/written by live processes in the tree
+    io_write_mb: float
+
+
+def _exit_code(status: int) -> int:
+    if hasattr(os, "waitstatus_to_exitcode"):
+        return os.waitstatus_to_exitcode(status)
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def wait_with_rusage(proc: subprocess.Popen, started: float) -> Optional[ResourceUsage]:
+    """Reap proc with os.wait4 and return its resource usage.
+
+    Sets proc.returncode so the Popen object behaves as if wait() was called.
+    Falls back to proc.wait() (and returns None) where wait4 is unavailable.
+    """
+
+    if not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    try:
+        _, status, ru = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        proc.wait()
+        return None
+    proc.returncode = _exit_code(status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss_scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return ResourceUsage(
+        wall=time.monotonic() - started,
+        user=ru.ru_utime,
+        system=ru.ru_stime,
+        max_rss_mb=ru.ru_maxrss / rss_scale,
+    )
+
+
+def _read_proc(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _meminfo() -> Dict[str, int]:
+    info: Dict[str, int] = {}
+    for line in _read_proc("/proc/meminfo").splitlines():
+        key, _, rest = line.partition(":")
+        parts = rest.split()
+        if parts and parts[0].isdigit():
+            info[key] = int(parts[0])  # kB
+    return info
+
+
+def cgroup_memory_mb() -> Optional[Tuple[float, float]]:
+    """(usage, limit) of this cgroup's memory, or None if unlimited / unknown."""
+
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        limit = _read_proc(limit_path).strip()
+        if not limit:
+            continue
+        # v1 reports "no limit" as a huge number rather than "max".
+        if limit == "max" or int(limit) >= 1 << 60:
+            return None
+        usage = int(_read_proc(usage_path).strip() or 0)
+        return usage / (1024 * 1024), int(limit) / (1024 * 1024)
+    return None
+
+
+def cgroup_oom_kills() -> Optional[int]:
+    """How many processes the OOM killer has killed in this cgroup, or None if unknown."""
+
+    # v2 memory.events and v1 memory.oom_control (Linux 4.13+) both have an "oom_kill N" line.
+    for path in ("/sys/fs/cgroup/memory.events", "/sys/fs/cgroup/memory/memory.oom_control"):
+        for line in _read_proc(path).splitlines():
+            key, _, value = line.partition(" ")
+            if key == "oom_kill" and value.strip().isdigit():
+                return int(value)
+    return None
+
+
+class ProcSampler:
+    """Samples a command's process tree and the host from /proc while it runs.
+
+    CPU time is summed over the live tree including each process's reaped
+    children (cutime/cstime), so short-lived compiler processes are counted.
+    Linux only; elsewhere it records nothing.
+    """
+
+    def __init__(self, pid: int, interval: float = 1.0) -> None:
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[ProcSample] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._page_mb = (os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096) / (1024 * 1024)
+
+    def start(self) -> "ProcSampler":
+        if os.path.isdir("/proc/self"):
+            self._thread = threading.Thread(target=self._run, name=f"sampler-{self.pid}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _tree(self) -> List[int]:
+        children: Dict[int, List[int]] = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            stat = _read_proc(f"/proc/{name}/stat")
+            # The command name is in parentheses and may contain spaces.
+            fields = stat[stat.rfind(")") + 2:].split()
+            if len(fields) > 1:
+                children.setdefault(int(fields[1]), []).append(int(name))
+        tree, stack = [], [self.pid]
+        while stack:
+            pid = stack.pop()
+            tree.append(pid)
+            stack.extend(children.get(pid, ()))
+        return tree
+
+    def _tree_totals(self):
+        cpu_ticks = rss_pages = read_bytes = write_bytes = 0
+        for pid in self._tree():
+            stat = _read_proc(f"/proc/{pid}/stat")
+            fields = stat[stat.rfind(")") + 2:].split()
+            if len(fields) > 14:
+                # utime, stime, cutime, cstime
+                cpu_ticks += sum(int(f) for f in fields[11:15])
+            statm = _read_proc(f"/proc/{pid}/statm").split()
+            if len(statm) > 1:
+                rss_pages += int(statm[1])
+            for line in _read_proc(f"/proc/{pid}/io").splitlines():
+                if line.startswith("read_bytes:"):
+                    read_bytes += int(line.split()[1])
+                elif line.startswith("write_bytes:"):
+                    write_bytes += int(line.split()[1])
+        return cpu_ticks, rss_pages, read_bytes, write_bytes
+
+    @staticmethod
+    def _host_cpu():
+        fields = _read_proc("/proc/stat").split("\n", 1)[0].split()[1:]
+        values = [int(f) for f in fields if f.isdigit()]
+        iowait = values[4] if len(values) > 4 else 0
+        return sum(values), iowait
+
+    def _run(self) -> None:
+        t0 = last_t = time.monotonic()
+        last_ticks = self._tree_totals()[0]
+        last_total, last_iowait = self._host_cpu()
+        while not self._stop.wait(self.interval):
+            now = time.monotonic()
+            ticks, rss_pages, read_bytes, write_bytes = self._tree_totals()
+            total, iowait = self._host_cpu()
+            mem = _meminfo()
+            available_mb, total_mb = mem.get("MemAvailable", 0) / 1024, mem.get("MemTotal", 0) / 1024
+            cgroup = cgroup_memory_mb()
+            if cgroup is not None:
+                usage_mb, limit_mb = cgroup
+                headroom_mb = max(0.0, limit_mb - usage_mb)
+                available_mb = min(available_mb, headroom_mb) if available_mb else headroom_mb
+                total_mb = min(total_mb, limit_mb) if total_mb else limit_mb
+            self.samples.append(
+                ProcSample(
+                    t=now - t0,
+                    cpu_cores=max(0, ticks - last_ticks) / self._tick / max(now - last_t, 1e-6),
+                    rss_mb=rss_pages * self._page_mb,
+                    mem_available_mb=available_mb,
+                    mem_total_mb=total_mb,
+                    swap_used_mb=(mem.get("SwapTotal", 0) - mem.get("SwapFree", 0)) / 1024,
+                    iowait_pct=100.0 * (iowait - last_iowait) / max(total - last_total, 1),
+                    io_read_mb=read_bytes / (1024 * 1024),
+                    io_write_mb=write_bytes / (1024 * 1024),
+                )
+            )
+            last_t, last_ticks, last_total, last_iowait = now, ticks, total, iowait
+
+
+def usable_cpu_count() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def classify_load(samples: List[ProcSample], cores: int) -> str:
+    """Best guess at what limited a command: CPU, memory, disk, or none of them."""
+
+    if not samples:
+        return "unknown"
+    # Both are limited by the cgroup in containers, which is what a build runs out of there.
+    mem_total_mb = min(s.mem_total_mb for s in samples)
+    swap_growth = samples[-1].swap_used_mb - samples[0].swap_used_mb
+    min_available = min(s.mem_available_mb for s in samples)
+    if swap_growth > 64 or (mem_total_mb and min_available < 0.05 * mem_total_mb):
+        return "memory-bound"
+    if sum(s.iowait_pct for s in samples) / len(samples) > 20:
+        return "disk-bound"
+    if sum(s.cpu_cores for s in samples) / len(samples) >= 0.75 * cores:
+        return "CPU-bound"
+    return "not resource-bound (network, locks or a serial phase)"
+
+
+# Commands running at least this long get a resource summary printed.
+RESOURCE_REPORT_SECONDS = 10.0
+
+
+def report_resource_usage(name: str, usage: Optional[ResourceUsage], samples: List[ProcSample]) -> None:
+    if usage is None or usage.wall < RESOURCE_REPORT_SECONDS:
+        return
+    cores = usable_cpu_count()
+    lines = [
+        f"{name}: {usage.wall:.1f}s wall, {usage.user:.1f}s user + {usage.system:.1f}s system CPU "
+        f"({(usage.user + usage.system) / max(usage.wall, 1e-6):.1f} of {cores} cores), "
+        f"max RSS {usage.max_rss_mb:.0f} MB"
+    ]
+    if samples:
+        lines.append(
+            f"peak tree RSS {max(s.rss_mb for s in samples):.0f} MB, "
+            f"lowest available memory {min(s.mem_available_mb for s in samples):.0f} MB, "
+            f"mean iowait {sum(s.iowait_pct for s in samples) / len(samples):.1f}%, "
+            f"-> {classify_load(samples, cores)}"
+        )
+    for line in lines:
+        emit_line(line, "resources")
+
+
 # ------------------------ helpers ------------------------
 
 
@@ -49,6 +473,24 @@ def print_banner() -> None:
     print()
 
 
+class CommandResult(subprocess.CompletedProcess):
+    """CompletedProcess plus the resources the command used."""
+
+    def __init__(self, args, returncode, stdout=None, stderr=None, usage=None, samples=None):
+        super().__init__(args, returncode, stdout, stderr)
+        self.usage: Optional[ResourceUsage] = usage
+        self.samples: List[ProcSample] = samples or []
+
+
+def _drain(stream, key: str, sink: dict, label: Optional[str]) -> None:
+    if label is None:
+        sink[key] = stream.read()
+    else:
+        for line in stream:
+            emit_line(line.rstrip("\r\n"), label)
+    stream.close()
+
+
 def run_cmd(
     cmd,
     *,
@@ -58,29 +500,137 @@ def run_cmd(
     shell: bool = False,
     env: Optional[dict] = None,
     cwd: Optional[str] = None,
+    label: Optional[str] = None,
 ):
-    """Wrapper around subprocess.run with basic error handling."""
+    """Wrapper around subprocess.Popen with basic error handling.
 
-    if capture_output:
-        result = subprocess.run(
-            cmd,
-            check=check,
-            capture_output=True,
-            text=text,
-            shell=shell,
-            env=env,
-            cwd=cwd,
-        )
-        return result.stdout
-    else:
-        return subprocess.run(
+    The child is reaped with os.wait4, so its CPU time and peak memory are
+    recorded in the command's trace span, and it is sampled from /proc while
+    it runs. With a label (and no capture_output), output is streamed line by
+    line with a ``[label]`` prefix instead of going straight to the terminal.
+    """
+
+    with TRACER.span(_command_span_name(cmd), cat="cmd", cmd=_command_text(cmd)) as span:
+        stream = label is not None and not capture_output
+        pipe = subprocess.PIPE if (capture_output or stream) else None
+        text_mode = text or stream
+        started = time.monotonic()
+        proc = subprocess.Popen(
             cmd,
-            check=check,
             shell=shell,
             env=env,
             cwd=cwd,
+            stdout=pipe,
+            stderr=pipe,
+            universal_newlines=text_mode,
+            errors="replace" if text_mode else None,
         )
 
+        output: dict = {}
+        readers = []
+        if pipe is not None:
+            for key, f in (("stdout", proc.stdout), ("stderr", proc.stderr)):
+                reader = threading.Thread(
+                    target=_drain, args=(f, key, output, label if stream else None), daemon=True
+                )
+                reader.start()
+                readers.append(reader)
+
+        sampler = ProcSampler(proc.pid).start()
+        try:
+            usage = wait_with_rusage(proc, started)
+        except BaseException:
+            proc.kill()
+            proc.wait()
+            raise
+        finally:
+            sampler.stop()
+            for reader in readers:
+                reader.join()
+
+        span["exit_code"] = proc.returncode
+        if usage is not None:
+            span.update(
+                user_cpu_s=round(usage.user, 3),
+                sys_cpu_s=round(usage.system, 3),
+                max_rss_mb=round(usage.max_rss_mb, 1),
+            )
+        if sampler.samples:
+            TRACER.counters(f"{_command_span_name(cmd)} resources", started, sampler.samples)
+        report_resource_usage(_command_span_name(cmd), usage, sampler.samples)
+
+        stdout, stderr = output.get("stdout"), output.get("stderr")
+        if check and proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, output=stdout, stderr=stderr)
+        if capture_output:
+            return stdout
+        return CommandResult(cmd, proc.returncode, stdout, stderr, usage, sampler.samples)
+
+
+# Serialises console output so that lines streamed from concurrent commands
+# never interleave mid-line (and never land in the middle of a prompt).
+_CONSOLE_LOCK = threading.RLock()
+
+
+def emit_line(line: str, label: Optional[str] = None) -> None:
+    with _CONSOLE_LOCK:
+        if label:
+            print(f"[{label}] {line}", flush=True)
+        else:
+            print(line, flush=True)
+
+
+async def run_cmd_async(
+    cmd,
+    *,
+    check: bool = True,
+    capture_output: bool = False,
+    shell: bool = False,
+    env: Optional[dict] = None,
+    cwd: Optional[str] = None,
+    label: Optional[str] = None,
+):
+    """Asyncio counterpart of run_cmd that streams output line by line.
+
+    Output is printed as it arrives, prefixed with ``[label]`` when a label is
+    given, so several commands can run concurrently and still be told apart.
+    Return values and errors mirror run_cmd: the captured stdout when
+    capture_output is set, a CommandResult otherwise, and
+    subprocess.CalledProcessError on failure when check is set.
+
+    The command runs through run_cmd on a worker thread rather than through
+    asyncio's subprocess support: asyncio's child watcher would reap the
+    process itself and its resource usage would be lost.
+    """
+
+    call = functools.partial(
+        run_cmd,
+        cmd,
+        check=check,
+        capture_output=capture_output,
+        shell=shell,
+        env=env,
+        cwd=cwd,
+        label=label if label is not None else "",
+    )
+    return await asyncio.get_event_loop().run_in_executor(None, in_current_context(call))
+
+
+def run_async(coro):
+    """Run a coroutine to completion on a fresh event loop."""
+
+    if hasattr(asyncio, "run"):
+        return asyncio.run(coro)
+
+    # Python 3.6 has no asyncio.run.
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
 
 def ask_yes_no(prompt: str, default: Optional[bool] = True) -> bool:
     if default is True:
@@ -168,6 +718,229 @@ def command_exists(name: str, env: Optional[dict] = None) -> bool:
     return shutil.which(name, path=(env or os.environ).get("PATH")) is not None
 
 
+# ------------------------ step graph ------------------------
+
+
+class StepFailed(Exception):
+    """Raised by a step action to stop the steps that depend on it."""
+
+
+class Step:
+    """One unit of work in a StepGraph.
+
+    ``inputs`` and ``outputs`` are resource names. A step starts once every
+    step producing one of its inputs has succeeded.
+    """
+
+    __slots__ = (
+        "name",
+        "action",
+        "inputs",
+        "outputs",
+        "interactive",
+        "status",
+        "started",
+        "finished",
+        "error",
+    )
+
+    def __init__(self, name, action, inputs, outputs, interactive):
+        self.name = name
+        self.action = action
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.interactive = interactive
+        self.status = "pending"
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+class StepGraph:
+    """A small dependency-graph executor for setup steps.
+
+    Actions are called with the dict of values produced so far and may return
+    a dict of output values. Coroutine actions run on the event loop, plain
+    functions on a worker thread. Interactive actions run on the event loop
+    thread itself, which pauses all streamed output while they wait for an
+    answer.
+    """
+
+    def __init__(self) -> None:
+        self.steps: Dict[str, Step] = {}
+        self.values: Dict[str, object] = {}
+        self._producers: Dict[str, Step] = {}
+        self._provided: set = set()
+        self._t0: Optional[float] = None
+
+    def add(self, name: str, action, *, inputs=(), outputs=(), interactive: bool = False) -> Step:
+        if name in self.steps:
+            raise ValueError(f"Duplicate step name: {name}")
+        step = Step(name, action, inputs, outputs, interactive)
+        for out in step.outputs:
+            if out in self._producers or out in self._provided:
+                raise ValueError(f"Output {out!r} is produced more than once")
+            self._producers[out] = step
+        self.steps[name] = step
+        return step
+
+    def provide(self, *names: str, value=None) -> None:
+        """Mark resources as already available (e.g. pyenv was installed earlier)."""
+
+        for name in names:
+            if name in self._producers:
+                raise ValueError(f"Output {name!r} is produced more than once")
+            self._provided.add(name)
+            self.values.setdefault(name, value)
+
+    def produces(self, name: str) -> bool:
+        return name in self._producers or name in self._provided
+
+    def dependencies(self, step: Step) -> List[Step]:
+        deps = []
+        for name in step.inputs:
+            if name in self._provided:
+                continue
+            if name not in self._producers:
+                raise ValueError(f"Step {step.name!r} needs {name!r}, which no step produces")
+            producer = self._producers[name]
+            if producer not in deps:
+                deps.append(producer)
+        return deps
+
+    def topological_order(self) -> List[Step]:
+        order: List[Step] = []
+        state: Dict[str, int] = {}
+
+        def visit(step: Step) -> None:
+            mark = state.get(step.name)
+            if mark == 2:
+                return
+            if mark == 1:
+                raise ValueError(f"Dependency cycle involving step {step.name!r}")
+            state[step.name] = 1
+            for dep in self.dependencies(step):
+                visit(dep)
+            state[step.name] = 2
+            order.append(step)
+
+        for step in self.steps.values():
+            visit(step)
+        return order
+
+    def run(self, max_workers: int = 4) -> bool:
+        """Run every step, returning True if all of them succeeded."""
+
+        self.topological_order()  # validate before starting anything
+        return run_async(self._run(max_workers))
+
+    async def _run(self, max_workers: int) -> bool:
+        loop = asyncio.get_event_loop()
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        slots = asyncio.Semaphore(max_workers)
+        tasks: Dict[str, "asyncio.Future"] = {}
+        self._t0 = time.monotonic()
+
+        async def execute(step: Step) -> bool:
+            deps = self.dependencies(step)
+            results = await asyncio.gather(*(tasks[d.name] for d in deps))
+            if not all(results):
+                step.status = "skipped"
+                return False
+
+            async with slots:
+                step.status = "running"
+                step.started = time.monotonic()
+                try:
+                    with TRACER.span(step.name, cat="graph") as span:
+                        span["status"] = "failed"
+                        if asyncio.iscoroutinefunction(step.action):
+                            produced = await step.action(self.values)
+                        elif step.interactive:
+                            with _CONSOLE_LOCK:
+                                produced = step.action(self.values)
+                        else:
+                            produced = await loop.run_in_executor(
+                                pool, in_current_context(step.action), self.values
+                            )
+                        span["status"] = "done"
+                except StepFailed as e:
+                    step.error = e
+                    step.status = "failed"
+                    if str(e):
+                        emit_line(str(e), step.name)
+                    return False
+                except Exception as e:  # noqa: BLE001
+                    step.error = e
+                    step.status = "failed"
+                    emit_line(f"Step failed: {e}", step.name)
+                    return False
+                finally:
+                    step.finished = time.monotonic()
+
+            for out in step.outputs:
+                self.values[out] = (produced or {}).get(out)
+            step.status = "done"
+            return True
+
+        try:
+            for step in self.topological_order():
+                tasks[step.name] = asyncio.ensure_future(execute(step))
+            results = await asyncio.gather(*tasks.values())
+        finally:
+            pool.shutdown(wait=True)
+        return all(results)
+
+    def critical_path(self) -> List[Step]:
+        """Return the chain of finished steps with the largest total duration."""
+
+        best: Dict[str, float] = {}
+        prev: Dict[str, Optional[Step]] = {}
+        for step in self.topological_order():
+            if step.started is None:
+                continue
+            before, via = 0.0, None
+            for dep in self.dependencies(step):
+                if dep.name in best and best[dep.name] > before:
+                    before, via = best[dep.name], dep
+            best[step.name] = before + step.duration
+            prev[step.name] = via
+
+        if not best:
+            return []
+        name = max(best, key=best.get)
+        path: List[Step] = []
+        step: Optional[Step] = self.steps[name]
+        while step is not None:
+            path.append(step)
+            step = prev[step.name]
+        return list(reversed(path))
+
+    def print_report(self) -> None:
+        print("\nStep timings:")
+        for step in sorted(self.steps.values(), key=lambda s: (s.started is None, s.started or 0)):
+            if step.started is None:
+                print(f"  {step.name:<24} {step.status}")
+                continue
+            offset = step.started - (self._t0 or step.started)
+            note = " (waiting for input)" if step.interactive else ""
+            print(
+                f"  {step.name:<24} {step.status:<8} start +{offset:7.2f}s  "
+                f"took {step.duration:7.2f}s{note}"
+            )
+
+        path = self.critical_path()
+        if path:
+            total = sum(s.duration for s in path)
+            print(f"Critical path ({total:.2f}s): " + " -> ".join(s.name for s in path))
+
+
 # ------------------------ pyenv installation ------------------------
 
 
@@ -220,6 +993,18 @@ def install_pyenv_macos(env: dict) -> dict:
     return env
 
 
+async def apt_update_async(env: dict) -> None:
+    await run_cmd_async(["sudo", "apt", "update"], env=env, label="apt")
+
+
+async def apt_install_async(packages: List[str], env: dict) -> None:
+    await run_cmd_async(["sudo", "apt", "install", "-y"] + packages, env=env, label="apt")
+
+
+async def git_clone_async(url: str, dest: Path, env: dict, *, label: str = "git") -> None:
+    await run_cmd_async(["git", "clone", url, str(dest)], env=env, label=label)
+
+
 def append_to_shell_rc_if_missing(snippet: str) -> None:
     shell = os.environ.get("SHELL", "")
     home = Path.home()
@@ -250,112 +1035,168 @@ def append_to_shell_rc_if_missing(snippet: str) -> None:
         print(f"Could not update {rc}: {e}")
 
 
-def install_pyenv_ubuntu_like(env: dict, *, is_wsl: bool) -> dict:
-    if command_exists("pyenv", env):
-        print("pyenv already appears to be installed.")
-        return ensure_pyenv_in_env(env)
+UBUNTU_BUILD_DEPS = [
+    "build-essential",
+    "curl",
+    "git",
+    "libssl-dev",
+    "zlib1g-dev",
+    "libbz2-dev",
+    "libreadline-dev",
+    "libsqlite3-dev",
+    "llvm",
+    "libncursesw5-dev",
+    "xz-utils",
+    "tk-dev",
+    "libxml2-dev",
+    "libxmlsec1-dev",
+    "libffi-dev",
+    "liblzma-dev",
+    "ccache",
+]
+
+
+def add_ubuntu_pyenv_steps(
+    graph: StepGraph,
+    env: dict,
+    *,
+    is_wsl: bool,
+    install_plugin: bool,
+    packages: Optional[List[str]] = None,
+) -> None:
+    """Add the apt / git / shell rc steps that bootstrap pyenv on Ubuntu.
+
+    Produces "build-deps", "pyenv", "pyenv-virtualenv" and "shell-rc". The
+    clones only wait for apt when git itself still has to be installed.
+    packages defaults to UBUNTU_BUILD_DEPS.
+    """
 
-    print("\npyenv is not installed.")
-    if not ask_yes_no("Install pyenv using git + apt (requires sudo)?", default=True):
-        print("Skipping pyenv installation at your request.")
-        return env
+    pyenv_root = Path.home() / ".pyenv"
+    plugins_dir = pyenv_root / "plugins"
+    virtualenv_dir = plugins_dir / "pyenv-virtualenv"
 
-    # Install build dependencies
-    print("\nInstalling build dependencies via apt (you may be prompted for your password)...")
-    deps = [
-        "build-essential",
-        "curl",
-        "git",
-        "libssl-dev",
-        "zlib1g-dev",
-        "libbz2-dev",
-        "libreadline-dev",
-        "libsqlite3-dev",
-        "llvm",
-        "libncursesw5-dev",
-        "xz-utils",
-        "tk-dev",
-        "libxml2-dev",
-        "libxmlsec1-dev",
-        "libffi-dev",
-        "liblzma-dev",
-    ]
-    try:
-        run_cmd(["sudo", "apt", "update"], check=True, env=env)
-        run_cmd(["sudo", "apt", "install", "-y"] + deps, check=True, env=env)
-    except subprocess.CalledProcessError as e:
-        print("apt installation failed:", e)
+    def sudo_access(values: dict) -> None:
+        # Ask for the password up front; a prompt in the middle of concurrently
+        # streamed output would be easy to miss.
+        print("\nRequesting sudo access for apt (you may be prompted for your password)...")
+        try:
+            run_cmd(["sudo", "-v"], check=True, env=env)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print("Could not obtain sudo access:", e)
 
-    pyenv_root = Path.home() / ".pyenv"
-    if pyenv_root.is_dir():
-        print(f"{pyenv_root} already exists; skipping git clone.")
-    else:
-        print("\nCloning pyenv into ~/.pyenv...")
+    async def apt_update(values: dict) -> None:
+        print("\nInstalling build dependencies via apt...")
         try:
-            run_cmd(
-                ["git", "clone", "https://github.com/pyenv/pyenv.git", str(pyenv_root)],
-                check=True,
-                env=env,
-            )
-        except subprocess.CalledProcessError as e:
-            print("Git clone for pyenv failed:", e)
+            await apt_update_async(env)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print("apt update failed:", e)
 
-    # Optional: install pyenv-virtualenv plugin here too
-    plugins_dir = pyenv_root / "plugins"
-    virtualenv_dir = plugins_dir / "pyenv-virtualenv"
-    if ask_yes_no("Install pyenv-virtualenv plugin as well?", default=True):
-        plugins_dir.mkdir(parents=True, exist_ok=True)
-        if virtualenv_dir.is_dir():
-            print("pyenv-virtualenv plugin directory already exists; skipping clone.")
+    async def apt_install(values: dict) -> None:
+        try:
+            await apt_install_async(packages or UBUNTU_BUILD_DEPS, env)
+        except (subprocess.CalledProcessError, OSError) as e:
+            print("apt installation failed:", e)
+
+    async def clone_pyenv(values: dict) -> None:
+        if pyenv_root.is_dir():
+            print(f"{pyenv_root} already exists; skipping git clone.")
         else:
-            print("Cloning pyenv-virtualenv plugin...")
+            print("\nCloning pyenv into ~/.pyenv...")
             try:
-                run_cmd(
-                    [
-                        "git",
-                        "clone",
-                        "https://github.com/pyenv/pyenv-virtualenv.git",
-                        str(virtualenv_dir),
-                    ],
-                    check=True,
-                    env=env,
-                )
-            except subprocess.CalledProcessError as e:
-                print("Git clone for pyenv-virtualenv failed:", e)
-
-    snippet = dedent(
-        """
-        # pyenv configuration
-        export PYENV_ROOT="$HOME/.pyenv"
-        export PATH="$PYENV_ROOT/bin:$PATH"
-        eval "$(pyenv init -)"
-        eval "$(pyenv virtualenv-init -)"
-        """
-    )
-    append_to_shell_rc_if_missing(snippet)
+                await git_clone_async("https://github.com/pyenv/pyenv.git", pyenv_root, env, label="pyenv")
+            except (subprocess.CalledProcessError, OSError) as e:
+                raise StepFailed(f"Git clone for pyenv failed: {e}")
+        ensure_pyenv_in_env(env)
 
-    env = ensure_pyenv_in_env(env)
-    print(
-        "\npyenv installation steps finished. You may need to restart your shell "
-        "or run 'exec $SHELL' for pyenv to be fully available in new terminals."
-    )
+    async def clone_virtualenv(values: dict) -> None:
+        if not install_plugin:
+            return
+        plugins_dir.mkdir(parents=True, exist_ok=True)
+        if virtualenv_dir.is_dir():
+            print("pyenv-virtualenv plugin directory already exists; skipping clone.")
+            return
+        print("Cloning pyenv-virtualenv plugin...")
+        try:
+            await git_clone_async(
+                "https://github.com/pyenv/pyenv-virtualenv.git",
+                virtualenv_dir,
+                env,
+                label="pyenv-virtualenv",
+            )
+        except (subprocess.CalledProcessError, OSError) as e:
+            print("Git clone for pyenv-virtualenv failed:", e)
 
-    if is_wsl:
+    def update_shell_rc(values: dict) -> None:
+        snippet = dedent(
+            """
+            # pyenv configuration
+            export PYENV_ROOT="$HOME/.pyenv"
+            export PATH="$PYENV_ROOT/bin:$PATH"
+            eval "$(pyenv init -)"
+            eval "$(pyenv virtualenv-init -)"
+            """
+        )
+        append_to_shell_rc_if_missing(snippet)
         print(
-            "Detected Ubuntu under WSL. Make sure you always run this script *inside* "
-            "your WSL/Ubuntu terminal (not in regular cmd.exe/PowerShell)."
+            "\npyenv installation steps finished. You may need to restart your shell "
+            "or run 'exec $SHELL' for pyenv to be fully available in new terminals."
         )
 
-    return env
+        if is_wsl:
+            print(
+                "Detected Ubuntu under WSL. Make sure you always run this script *inside* "
+                "your WSL/Ubuntu terminal (not in regular cmd.exe/PowerShell)."
+            )
+
+    graph.add("sudo", sudo_access, outputs=["sudo"], interactive=True)
+    graph.add("apt-update", apt_update, inputs=["sudo"], outputs=["apt-index"])
+    graph.add("apt-install", apt_install, inputs=["apt-index"], outputs=["build-deps"])
+    # The plugin lives inside ~/.pyenv, so it can only be cloned after pyenv itself.
+    clone_inputs = [] if command_exists("git", env) else ["build-deps"]
+    graph.add("clone-pyenv", clone_pyenv, inputs=clone_inputs, outputs=["pyenv"])
+    graph.add("clone-pyenv-virtualenv", clone_virtualenv, inputs=["pyenv"], outputs=["pyenv-virtualenv"])
+    graph.add("shell-rc", update_shell_rc, inputs=["pyenv"], outputs=["shell-rc"])
+
+
+def install_pyenv_ubuntu_like(
+    env: dict, *, is_wsl: bool, graph: Optional[StepGraph] = None, packages: Optional[List[str]] = None
+) -> dict:
+    """Install pyenv with apt + git.
+
+    When a graph is given the installation steps are only added to it (so they
+    can overlap with later steps) and the caller is responsible for running it.
+    """
+
+    if command_exists("pyenv", env):
+        print("pyenv already appears to be installed.")
+        return ensure_pyenv_in_env(env)
+
+    print("\npyenv is not installed.")
+    if not ask_yes_no("Install pyenv using git + apt (requires sudo)?", default=True):
+        print("Skipping pyenv installation at your request.")
+        return env
+
+    install_plugin = ask_yes_no("Install pyenv-virtualenv plugin as well?", default=True)
+
+    if graph is not None:
+        add_ubuntu_pyenv_steps(graph, env, is_wsl=is_wsl, install_plugin=install_plugin, packages=packages)
+        return env
 
+    graph = StepGraph()
+    add_ubuntu_pyenv_steps(graph, env, is_wsl=is_wsl, install_plugin=install_plugin, packages=packages)
+    graph.run()
+    graph.print_report()
+    return ensure_pyenv_in_env(env)
 
-def ensure_pyenv_and_virtualenv(env_name: str, env: dict) -> dict:
+
+@traced
+def ensure_pyenv_and_virtualenv(env_name: str, env: dict, packages: Optional[List[str]] = None) -> dict:
     """Ensure pyenv is available; for Ubuntu/macOS also offer pyenv-virtualenv."""
 
     if env_name == "macos":
         env = install_pyenv_macos(env)
     elif env_name in {"ubuntu", "wsl_ubuntu"}:
-        env = install_pyenv_ubuntu_like(env, is_wsl=(env_name == "wsl_ubuntu"))
+        env = install_pyenv_ubuntu_like(env, is_wsl=(env_name == "wsl_ubuntu"), packages=packages)
     else:
         print("Unsupported environment for automatic pyenv installation.")
 
@@ -395,44 +1236,2137 @@ def ensure_pyenv_and_virtualenv(env_name: str, env: dict) -> dict:
     return env
 
 
-# ------------------------ version selection & installation ------------------------
+# ------------------------ pyenv query cache ------------------------
 
 
-def list_available_versions(env: dict) -> List[str]:
-    print("\nRetrieving available CPython versions from pyenv (this may take a few seconds)...")
-    try:
-        out = run_cmd(
-            ["pyenv", "install", "--list"], capture_output=True, check=True, env=env
-        )
-    except subprocess.CalledProcessError as e:
-        print("Failed to list versions from pyenv:", e)
-        return []
+_QUERY_CACHE_LOCK = threading.Lock()
 
-    versions: list[str] = []
-    for line in out.splitlines():
-        v = line.strip()
-        if re.fullmatch(r"\d+\.\d+\.\d+", v):
-            versions.append(v)
 
-    if not versions:
-        print("No CPython versions found in pyenv output.")
-    return versions
+def cache_dir() -> Path:
+    """Directory for this script's persistent caches (honours XDG_CACHE_HOME)."""
 
+    base = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(base) / "python_env_setup"
 
-def prompt_for_version(env: dict) -> Optional[str]:
-    versions = list_available_versions(env)
-    if not versions:
+
+def pyenv_root(env: dict) -> Path:
+    return Path(env.get("PYENV_ROOT") or str(Path.home() / ".pyenv"))
+
+
+def pyenv_install_dir(env: dict) -> Optional[Path]:
+    """Return the directory pyenv itself is installed in (not PYENV_ROOT).
+
+    For a git checkout both are the same; for Homebrew this is the Cellar
+    prefix. Found by resolving the ``pyenv`` executable, which is a symlink to
+    ``libexec/pyenv``.
+    """
+
+    exe = shutil.which("pyenv", path=env.get("PATH"))
+    if exe is None:
         return None
+    return Path(os.path.realpath(exe)).parent.parent
 
-    # Show the most recent 15 versions
-    latest = versions[-15:]
-    print("\nSelect a Python version to install:")
-    for i, v in enumerate(latest, start=1):
-        print(f"  {i:2d}) {v}")
 
-    print("\nYou can choose by number, or type an exact version (e.g. 3.12.4).")
+def find_python_build_dir(env: dict) -> Optional[Path]:
+    """Locate python-build's definition directory."""
 
-    while True:
+    candidates = [pyenv_root(env) / "plugins" / "python-build" / "share" / "python-build"]
+    install_dir = pyenv_install_dir(env)
+    if install_dir is not None:
+        candidates.append(install_dir / "plugins" / "python-build" / "share" / "python-build")
+        candidates.append(install_dir / "share" / "python-build")
+    for path in candidates:
+        if path.is_dir():
+            return path
+    return None
+
+
+def pyenv_version_string(env: dict) -> str:
+    """Read pyenv's version from its sources instead of running ``pyenv --version``."""
+
+    install_dir = pyenv_install_dir(env)
+    if install_dir is None:
+        return ""
+    script = install_dir / "libexec" / "pyenv---version"
+    try:
+        text = script.read_text(encoding="utf-8")
+        stamp = script.stat().st_mtime_ns
+    except OSError:
+        return ""
+    m = re.search(r'^version="([^"]+)"', text, re.MULTILINE)
+    return f"{m.group(1) if m else '?'}@{install_dir}:{stamp}"
+
+
+def _mtime_ns(path: Optional[Path]) -> Optional[int]:
+    if path is None:
+        return None
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def pyenv_query_fingerprint(env: dict) -> str:
+    """Fingerprint of everything a read-only pyenv query's output depends on."""
+
+    root = pyenv_root(env)
+    return json.dumps(
+        [
+            pyenv_version_string(env),
+            str(root),
+            _mtime_ns(root / "versions"),
+            _mtime_ns(find_python_build_dir(env)),
+        ]
+    )
+
+
+def _load_json(path: Path) -> dict:
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_json(path: Path, data: dict) -> None:
+    """Atomically replace path with data; failures are ignored (it's only a cache)."""
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(str(tmp), str(path))
+    except OSError:
+        pass
+
+
+def cached_pyenv_query(args: List[str], env: dict) -> str:
+    """Run a read-only pyenv command, memoising its stdout on disk.
+
+    Entries are invalidated automatically when pyenv is upgraded, or when
+    ``$PYENV_ROOT/versions`` or python-build's definitions change. Raises
+    subprocess.CalledProcessError like run_cmd; failures are not cached.
+    """
+
+    cache_file = cache_dir() / "pyenv-queries.json"
+    key = " ".join(args)
+    fingerprint = pyenv_query_fingerprint(env)
+
+    with _QUERY_CACHE_LOCK:
+        entry = _load_json(cache_file).get(key)
+    if isinstance(entry, dict) and entry.get("fingerprint") == fingerprint:
+        return entry.get("stdout", "")
+
+    out = run_cmd(["pyenv"] + list(args), capture_output=True, check=True, env=env)
+
+    with _QUERY_CACHE_LOCK:
+        data = _load_json(cache_file)
+        data[key] = {"fingerprint": fingerprint, "stdout": out}
+        _save_json(cache_file, data)
+    return out
+
+
+# ------------------------ installed versions inventory ------------------------
+
+
+class InstalledVersion(NamedTuple):
+    """An entry under ``$PYENV_ROOT/versions``, as ``pyenv versions`` would list it."""
+
+    name: str
+    path: str
+    is_virtualenv: bool
+    base_interpreter: Optional[str]
+    python_version: Optional[str]
+    size: Optional[int]
+    mtime: float
+
+
+def parse_pyvenv_cfg(path: str) -> Dict[str, str]:
+    """Parse a ``pyvenv.cfg`` file into a dict; returns {} if it can't be read."""
+
+    data: Dict[str, str] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                key, sep, value = line.partition("=")
+                if sep:
+                    data[key.strip().lower()] = value.strip()
+    except OSError:
+        return {}
+    return data
+
+
+def tree_size(path: str) -> int:
+    """Total size in bytes of the files under path (symlinks are not followed)."""
+
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total
+
+
+def _inventory_record(name: str, path: str, mtime: float, with_size: bool) -> InstalledVersion:
+    cfg = parse_pyvenv_cfg(os.path.join(path, "pyvenv.cfg"))
+    is_venv = bool(cfg)
+    base = None
+    if is_venv:
+        base = cfg.get("base-executable") or (
+            os.path.join(cfg["home"], "python") if cfg.get("home") else None
+        )
+    python_version = cfg.get("version") or cfg.get("version_info")
+    if python_version is None and not is_venv:
+        python_version = name
+    return InstalledVersion(
+        name=name,
+        path=path,
+        is_virtualenv=is_venv,
+        base_interpreter=base,
+        python_version=python_version,
+        size=tree_size(path) if with_size else None,
+        mtime=mtime,
+    )
+
+
+def scan_installed_versions(env: dict, *, with_size: bool = False) -> List[InstalledVersion]:
+    """List installed versions and virtualenvs by reading ``$PYENV_ROOT/versions``.
+
+    This is equivalent to ``pyenv versions --bare`` plus pyenv-virtualenv's
+    ``<version>/envs/<name>`` entries, without starting pyenv. Sizes require
+    walking every tree, so they are only computed when with_size is set.
+    """
+
+    versions_dir = pyenv_root(env) / "versions"
+    records: List[InstalledVersion] = []
+    try:
+        entries = sorted(os.scandir(str(versions_dir)), key=lambda e: e.name)
+    except OSError:
+        return records
+
+    for entry in entries:
+        if entry.name.startswith("."):
+            continue
+        try:
+            if not entry.is_dir():
+                continue
+            mtime = entry.stat().st_mtime
+        except OSError:
+            continue
+        records.append(_inventory_record(entry.name, entry.path, mtime, with_size))
+
+        # pyenv-virtualenv keeps envs inside their base version; the top-level
+        # entry for an env is only a symlink to one of these.
+        if entry.is_symlink():
+            continue
+        envs_dir = os.path.join(entry.path, "envs")
+        try:
+            with os.scandir(envs_dir) as it:
+                env_entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for env_entry in env_entries:
+            try:
+                if not env_entry.is_dir():
+                    continue
+                mtime = env_entry.stat().st_mtime
+            except OSError:
+                continue
+            name = f"{entry.name}/envs/{env_entry.name}"
+            records.append(_inventory_record(name, env_entry.path, mtime, with_size))
+    return records
+
+
+# ------------------------ version catalog ------------------------
+
+
+class CatalogEntry(NamedTuple):
+    """A CPython release as described by its python-build definition file."""
+
+    version: str
+    url: Optional[str]
+    sha256: Optional[str]
+    definition: str
+
+
+# A trailing "t" marks a free-threaded (--disable-gil) build, e.g. 3.13.1t.
+CPYTHON_VERSION_RE = re.compile(r"\d+\.\d+\.\d+t?")
+
+# The first Python tarball in a definition is the preferred (.tar.xz) one; the
+# .tgz fallback, if any, follows it.
+_PYTHON_PACKAGE_RE = re.compile(
+    r'install_package\s+"Python-[^"]*"\s+"([^"#]+)(?:#([0-9A-Fa-f]{64}))?"'
+)
+
+# Free-threaded definitions set a flag and then source the regular one:
+#   source "$(dirname "${BASH_SOURCE[0]}")"/3.13.1
+_SOURCE_DEFINITION_RE = re.compile(r'^source\s+"\$\(dirname [^\n]*\)"/([\w.-]+)\s*$', re.M)
+
+
+def parse_definition(path: str, version: str) -> Optional[CatalogEntry]:
+    """Extract the CPython source URL and sha256 from one definition file."""
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    except OSError:
+        return None
+    m = _PYTHON_PACKAGE_RE.search(text)
+    if m is None:
+        src = _SOURCE_DEFINITION_RE.search(text)
+        if src is not None and src.group(1) != os.path.basename(path):
+            base = parse_definition(os.path.join(os.path.dirname(path), src.group(1)), src.group(1))
+            if base is not None:
+                return base._replace(version=version, definition=path)
+    if m is not None and m.group(1).startswith("$"):
+        # Some older definitions pick the tarball in shell first, e.g.
+        # src="https://...tar.xz#<sha>" ... install_package "Python-3.4.10" "$src"
+        var = re.escape(m.group(1)[1:].strip("{}"))
+        m = re.search(r'\b' + var + r'="([^"#]+)(?:#([0-9A-Fa-f]{64}))?"', text)
+    if m is None:
+        return CatalogEntry(version, None, None, path)
+    sha = m.group(2).lower() if m.group(2) else None
+    return CatalogEntry(version, m.group(1), sha, path)
+
+
+def version_sort_key(version: str):
+    # 3.13.1t sorts right after 3.13.1.
+    return tuple(int(part) for part in re.findall(r"\d+", version)) + (version.endswith("t"),)
+
+
+def is_free_threaded(version: str) -> bool:
+    """Whether a version (or installed name such as 3.13.1t-opt) is a free-threaded build."""
+
+    return bool(re.match(r"\d+\.\d+\.\d+t(?:-|$)", version))
+
+
+def build_version_catalog(definitions_dir: str) -> Dict[str, CatalogEntry]:
+    """Parse every CPython definition in definitions_dir, sorted by version."""
+
+    entries: List[CatalogEntry] = []
+    try:
+        with os.scandir(definitions_dir) as it:
+            for de in it:
+                if not CPYTHON_VERSION_RE.fullmatch(de.name):
+                    continue
+                entry = parse_definition(de.path, de.name)
+                if entry is not None:
+                    entries.append(entry)
+    except OSError:
+        return {}
+    entries.sort(key=lambda e: version_sort_key(e.version))
+    return {e.version: e for e in entries}
+
+
+# Bump when build_version_catalog changes what it extracts, so indexes saved
+# by older versions of this script are rebuilt.
+CATALOG_FORMAT = 2
+
+
+def load_version_catalog(env: dict) -> Optional[Dict[str, CatalogEntry]]:
+    """Return the version catalog, or None if python-build's definitions can't be found.
+
+    The parsed index is kept in the cache directory and rebuilt whenever the
+    definitions directory changes (e.g. after ``pyenv update``).
+    """
+
+    definitions_dir = find_python_build_dir(env)
+    if definitions_dir is None:
+        return None
+
+    cache_file = cache_dir() / "version-catalog.json"
+    fingerprint = [str(definitions_dir), _mtime_ns(definitions_dir), CATALOG_FORMAT]
+    with _QUERY_CACHE_LOCK:
+        data = _load_json(cache_file)
+    if data.get("fingerprint") == fingerprint and isinstance(data.get("entries"), list):
+        try:
+            return {row[0]: CatalogEntry(*row) for row in data["entries"]}
+        except (TypeError, IndexError):
+            pass
+
+    catalog = build_version_catalog(str(definitions_dir))
+    with _QUERY_CACHE_LOCK:
+        _save_json(cache_file, {"fingerprint": fingerprint, "entries": [list(e) for e in catalog.values()]})
+    return catalog
+
+
+# ------------------------ version index ------------------------
+
+
+class Version:
+    """A CPython release number (``x.y.z``, or ``x.y.zt`` if free-threaded) that sorts numerically.
+
+    Regular releases sort before all free-threaded ones, so each kind forms
+    a contiguous run in a sorted list.
+    """
+
+    __slots__ = ("key", "text", "free_threaded")
+
+    def __init__(self, text: str) -> None:
+        m = re.fullmatch(r"(\d+)\.(\d+)\.(\d+)(t?)", text)
+        if m is None:
+            raise ValueError(f"Not a CPython version: {text!r}")
+        self.key = (int(m.group(1)), int(m.group(2)), int(m.group(3)))
+        self.free_threaded = bool(m.group(4))
+        self.text = text
+
+    @property
+    def minor(self):
+        return self.key[:2]
+
+    @property
+    def sort_key(self):
+        return (self.free_threaded,) + self.key
+
+    def __eq__(self, other):
+        return isinstance(other, Version) and self.sort_key == other.sort_key
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+    def __hash__(self):
+        return hash(self.sort_key)
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Version({self.text!r})"
+
+
+class VersionIndex:
+    """Sorted index of available versions supporting prefix and "latest" queries.
+
+    Lookups bisect over the sorted version keys, so membership checks and
+    prefix resolution are O(log n).
+    """
+
+    __slots__ = ("_versions", "_keys")
+
+    def __init__(self, versions) -> None:
+        parsed = set()
+        for v in versions:
+            try:
+                parsed.add(v if isinstance(v, Version) else Version(v))
+            except ValueError:
+                continue
+        self._versions: List[Version] = sorted(parsed)
+        self._keys = [v.sort_key for v in self._versions]
+
+    def __len__(self) -> int:
+        return len(self._versions)
+
+    def __iter__(self):
+        return (str(v) for v in self._versions)
+
+    def __contains__(self, text) -> bool:
+        try:
+            key = Version(text).sort_key
+        except (TypeError, ValueError):
+            return False
+        i = bisect.bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def latest(self, prefix=(), *, free_threaded: bool = False) -> Optional[str]:
+        """Newest version whose key starts with prefix (a tuple of ints)."""
+
+        prefix = (free_threaded,) + tuple(prefix)
+        # Every key with this prefix sorts before prefix + (inf,).
+        i = bisect.bisect_right(self._keys, prefix + (float("inf"),))
+        if i and self._keys[i - 1][: len(prefix)] == prefix:
+            return str(self._versions[i - 1])
+        return None
+
+    def resolve(self, spec: str) -> Optional[str]:
+        """Resolve "latest", "3", "3.12" or "3.12.4" to an available version.
+
+        A trailing "t" ("3.13t", "3.13.1t") selects free-threaded builds.
+        """
+
+        spec = spec.strip().lower()
+        if spec == "latest":
+            return self.latest()
+        if spec.startswith("latest"):
+            spec = spec[len("latest"):].strip(" -:")
+        m = re.fullmatch(r"(\d+(?:\.\d+){0,2})(t?)", spec)
+        if m is None:
+            return None
+        prefix = tuple(int(part) for part in m.group(1).split("."))
+        if len(prefix) == 3:
+            return spec if spec in self else None
+        return self.latest(prefix, free_threaded=bool(m.group(2)))
+
+    def latest_per_minor(self, *, free_threaded: bool = False) -> List[str]:
+        """The newest patch release of every minor version, oldest minor first."""
+
+        versions = [v for v in self._versions if v.free_threaded == free_threaded]
+        result: List[str] = []
+        for i, v in enumerate(versions):
+            if i + 1 == len(versions) or versions[i + 1].minor != v.minor:
+                result.append(str(v))
+        return result
+
+
+# ------------------------ build scheduling ------------------------
+
+
+# Rough peak memory of one compiler process while building CPython, plus
+# headroom kept free for the rest of the machine.
+MB_PER_BUILD_JOB = 400
+MB_RESERVED = 256
+
+
+class BuildPlan(NamedTuple):
+    """How many make jobs a build should use, and why."""
+
+    jobs: int
+    cpu_limit: int
+    memory_limit: Optional[int]  # None if available memory is unknown
+    reason: str
+
+
+def _read_first_line(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit() -> Optional[float]:
+    """CPU quota of this cgroup in cores, or None if unlimited / unknown."""
+
+    line = _read_first_line("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota|max> <period>"
+    if line:
+        quota, _, period = line.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    quota = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")  # cgroup v1
+    period = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def cgroup_memory_headroom_mb() -> Optional[float]:
+    """Memory left before this cgroup's limit is hit, or None if unlimited / unknown."""
+
+    cgroup = cgroup_memory_mb()
+    if cgroup is None:
+        return None
+    usage, limit = cgroup
+    return max(0.0, limit - usage)
+
+
+def _vm_stat_available_mb() -> Optional[float]:
+    """Free plus reclaimable memory on macOS, from ``vm_stat``."""
+
+    try:
+        out = subprocess.run(
+            ["vm_stat"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    page = re.search(r"page size of (\d+) bytes", out)
+    pages = {
+        key.strip(): int(value.strip().rstrip("."))
+        for key, _, value in (line.partition(":") for line in out.splitlines()[1:])
+        if value.strip().rstrip(".").isdigit()
+    }
+    if page is None or "Pages free" not in pages:
+        return None
+    free = sum(pages.get(k, 0) for k in ("Pages free", "Pages inactive", "Pages speculative"))
+    return free * int(page.group(1)) / (1024 * 1024)
+
+
+def available_memory_mb() -> Optional[float]:
+    """Memory available to new processes, or None if it can't be determined."""
+
+    meminfo = _meminfo()
+    if "MemAvailable" in meminfo:
+        available: Optional[float] = meminfo["MemAvailable"] / 1024
+    elif sys.platform == "darwin":
+        available = _vm_stat_available_mb()
+    else:
+        available = None
+    headroom = cgroup_memory_headroom_mb()
+    if headroom is not None:
+        available = min(available, headroom) if available is not None else headroom
+    return available
+
+
+def cpu_model() -> str:
+    for line in _read_proc("/proc/cpuinfo").splitlines():
+        if line.startswith("model name"):
+            return line.split(":", 1)[1].strip()
+    return platform.processor()
+
+
+def host_signature() -> str:
+    """Identifies the machine shape that build timings are comparable across."""
+
+    mem_gb = round(_meminfo().get("MemTotal", 0) / (1024 * 1024))
+    return f"{platform.machine()}|{cpu_model()}|{os.cpu_count()}cpu|{mem_gb}GB"
+
+
+def build_history_file() -> Path:
+    return cache_dir() / "build-history.json"
+
+
+def load_build_history() -> List[dict]:
+    with _QUERY_CACHE_LOCK:
+        records = _load_json(build_history_file()).get("builds", [])
+    return [r for r in records if isinstance(r, dict)]
+
+
+def record_build(version: str, jobs: int, seconds: float, *, memory_bound: bool = False, **extra) -> None:
+    """Remember how long a build took, for auto-tuning future job counts."""
+
+    record = dict(
+        host=host_signature(),
+        version=version,
+        jobs=jobs,
+        seconds=round(seconds, 1),
+        memory_bound=memory_bound,
+        when=int(time.time()),
+    )
+    record.update(extra)
+    with _QUERY_CACHE_LOCK:
+        data = _load_json(build_history_file())
+        builds = [r for r in data.get("builds", []) if isinstance(r, dict)]
+        builds.append(record)
+        data["builds"] = builds[-500:]
+        _save_json(build_history_file(), data)
+
+
+def host_defaults_file() -> Path:
+    return cache_dir() / "host-defaults.json"
+
+
+def load_host_default() -> Optional[dict]:
+    """The build configuration --build-matrix chose for this host, if any."""
+
+    with _QUERY_CACHE_LOCK:
+        record = _load_json(host_defaults_file()).get(host_signature())
+    if not isinstance(record, dict) or record.get("config") not in BUILD_CONFIGURATIONS:
+        return None
+    return record
+
+
+def save_host_default(config: str, **details) -> None:
+    record = dict(config=config, when=int(time.time()))
+    record.update(details)
+    with _QUERY_CACHE_LOCK:
+        data = _load_json(host_defaults_file())
+        data[host_signature()] = record
+        _save_json(host_defaults_file(), data)
+
+
+def plan_build_jobs(
+    version: str,
+    *,
+    cpu_share: float = 1.0,
+    memory_share: float = 1.0,
+    mb_per_job: int = MB_PER_BUILD_JOB,
+    profile: str = "default",
+) -> BuildPlan:
+    """Pick the ``make -j`` level for building version on this host.
+
+    The ceiling is the smaller of the usable cores (affinity and cgroup quota)
+    and the number of compiler processes that fit in available memory, each
+    scaled by this build's share when several builds run at once. Below that ceiling, past
+    builds of the same minor version on this host decide: an untried ceiling
+    is tried first, then job counts a step below the fastest one measured so
+    far, until a lower count turns out slower; after that the fastest job
+    count that didn't run out of memory wins. Builds that had to download
+    their sources are not timed.
+    """
+
+    cpus = usable_cpu_count()
+    quota = cgroup_cpu_limit()
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota + 0.5)))
+    cpu_limit = max(1, int(cpus * cpu_share))
+    available = available_memory_mb()
+    if available is None:
+        memory_limit = None
+        cap = cpu_limit
+        limited_by = "cores (available memory unknown)"
+    else:
+        memory_limit = max(1, int((available - MB_RESERVED) * memory_share // mb_per_job))
+        cap = min(cpu_limit, memory_limit)
+        limited_by = "cores" if cpu_limit <= memory_limit else "memory"
+
+    minor = ".".join(version.split(".")[:2])
+    host = host_signature()
+    measured: Dict[int, float] = {}
+    oom_jobs = set()
+    for record in load_build_history():
+        if record.get("host") != host or ".".join(str(record.get("version", "")).split(".")[:2]) != minor:
+            continue
+        if record.get("profile", "default") != profile:
+            continue
+        jobs = int(record.get("jobs", 0))
+        if record.get("memory_bound"):
+            oom_jobs.add(jobs)
+            continue
+        if record.get("downloaded"):
+            continue
+        seconds = float(record.get("seconds", 0))
+        measured[jobs] = min(seconds, measured.get(jobs, seconds))
+
+    # Never go back to a job count that previously pushed the host into swap.
+    while cap > 1 and cap in oom_jobs:
+        cap -= 1
+        limited_by = "memory (earlier build at a higher -j ran short)"
+
+    candidates = {j: t for j, t in measured.items() if j <= cap}
+    if cap in candidates:
+        jobs = min(candidates, key=candidates.get)
+        probe = jobs - max(1, jobs // 4)
+        if probe >= 1 and probe not in measured and probe not in oom_jobs:
+            reason = (
+                f"trying fewer jobs than the fastest measured on this host for {minor} "
+                f"(-j{jobs}: {candidates[jobs]:.0f}s); limit {cap} set by {limited_by}"
+            )
+            jobs = probe
+        else:
+            reason = (
+                f"fastest measured on this host for {minor}: {candidates[jobs]:.0f}s; "
+                f"limit {cap} set by {limited_by}"
+            )
+    else:
+        jobs = cap
+        memory_note = "" if memory_limit is None else f", memory for {memory_limit} job(s)"
+        reason = f"limited by {limited_by}: {cpu_limit} core(s){memory_note}"
+    return BuildPlan(jobs=jobs, cpu_limit=cpu_limit, memory_limit=memory_limit, reason=reason)
+
+
+# Space a CPython build tree takes (sources, objects, PGO data); LTO roughly
+# doubles the object files.
+MB_BUILD_TREE = 1500
+
+# RAM-backed places to build in, in order of preference.
+TMPFS_CANDIDATES = ("/dev/shm", "$XDG_RUNTIME_DIR", "/tmp")
+
+
+def tmpfs_mounts() -> Dict[str, List[str]]:
+    """Mount point -> mount options of every tmpfs, from /proc/mounts."""
+
+    mounts: Dict[str, List[str]] = {}
+    for line in _read_proc("/proc/mounts").splitlines():
+        fields = line.split()
+        if len(fields) >= 4 and fields[2] == "tmpfs":
+            mounts[fields[1]] = fields[3].split(",")
+    return mounts
+
+
+def make_tmpfs_build_dir(name: str, mb_needed: float, mb_for_jobs: float, memory_share: float = 1.0) -> Optional[str]:
+    """Create a build directory on a tmpfs, if one has room for the build tree.
+
+    The tree lives in RAM, so besides free space on the tmpfs this build's
+    share of available memory must still cover the compiler jobs afterwards.
+    noexec mounts are skipped: configure runs the test programs it compiles.
+    """
+
+    mounts = tmpfs_mounts()
+    available = available_memory_mb()
+    if available is None:
+        print("Building on disk: available memory is unknown.")
+        return None
+    spare_mb = available * memory_share - MB_RESERVED * memory_share - mb_for_jobs
+    if spare_mb < mb_needed:
+        print(
+            f"Building on disk: a tmpfs build needs ~{mb_needed:.0f} MB of RAM beyond the compiler jobs, "
+            f"but only {max(spare_mb, 0):.0f} MB is spare."
+        )
+        return None
+    for candidate in TMPFS_CANDIDATES:
+        path = os.path.expandvars(candidate)
+        options = mounts.get(path)
+        if options is None or "noexec" in options or not os.access(path, os.W_OK):
+            continue
+        try:
+            st = os.statvfs(path)
+        except OSError:
+            continue
+        if st.f_bavail * st.f_frsize / (1024 * 1024) * memory_share < mb_needed:
+            continue
+        try:
+            return tempfile.mkdtemp(prefix=f"python-build-{name}-", dir=path)
+        except OSError:
+            continue
+    print("Building on disk: no writable, exec-enabled tmpfs with enough free space was found.")
+    return None
+
+
+def tmpfs_ran_out(build_dir: str) -> bool:
+    """Whether a build that failed in build_dir (on a tmpfs) ran short of space there.
+
+    python-build leaves the failed tree and its log in TMPDIR, so the
+    filesystem is still (nearly) full, or the log ends with ENOSPC.
+    """
+
+    try:
+        st = os.statvfs(build_dir)
+    except OSError:
+        return False
+    if st.f_bavail * st.f_frsize < 64 * 1024 * 1024:
+        return True
+    for log in Path(build_dir).glob("python-build.*.log"):
+        try:
+            with log.open("rb") as f:
+                f.seek(max(0, log.stat().st_size - 64 * 1024))
+                if b"No space left on device" in f.read():
+                    return True
+        except OSError:
+            continue
+    return False
+
+
+def move_failed_build(tmpfs_dir: str, dest: str) -> str:
+    """Move python-build's log and working tree out of a tmpfs build directory.
+
+    They are what python-build's failure message points at, but in tmpfs
+    they would hold on to RAM. Returns the directory that now holds them.
+    """
+
+    try:
+        os.makedirs(dest, exist_ok=True)
+        for entry in sorted(os.listdir(tmpfs_dir)):
+            shutil.move(os.path.join(tmpfs_dir, entry), os.path.join(dest, entry))
+        os.rmdir(tmpfs_dir)
+    except OSError as e:
+        print(f"Could not move the failed build out of tmpfs ({e}); what is left of it stays in {tmpfs_dir}.")
+        return tmpfs_dir
+    print(f"Moved python-build's log and working tree from {tmpfs_dir} to {dest}.")
+    return dest
+
+
+def report_build_location(version: str, profile: str, location: str, seconds: float) -> None:
+    """Compare a build's time with recorded builds of the same kind in the other location."""
+
+    other = "disk" if location == "tmpfs" else "tmpfs"
+    baseline = typical_build_value(version, profile, location=other)
+    minor = ".".join(version.split(".")[:2])
+    if baseline is None:
+        print(f"Built in {location} in {seconds:.0f}s; no {other} build of {minor} ({profile}) is recorded yet.")
+        return
+    print(
+        f"Built in {location} in {seconds:.0f}s; {profile} builds of {minor} on {other} took "
+        f"{baseline:.0f}s on this host ({baseline / max(seconds, 1e-6):.2f}x)."
+    )
+
+
+def with_make_jobs(make_opts: str, jobs: int) -> str:
+    """Return make_opts with any existing -j/--jobs option replaced by -j<jobs>.
+
+    Handles the attached (``-j8``, ``--jobs=8``) and separate (``-j 8``,
+    ``--jobs 8``) forms; python-build's own default is ``-j <cores>``.
+    """
+
+    kept: List[str] = []
+    opts = make_opts.split()
+    i = 0
+    while i < len(opts):
+        opt = opts[i]
+        i += 1
+        if re.fullmatch(r"-j\d*|--jobs(=\d+)?", opt):
+            if opt in ("-j", "--jobs") and i < len(opts) and opts[i].isdigit():
+                i += 1
+            continue
+        kept.append(opt)
+    return " ".join(kept + [f"-j{jobs}"])
+
+
+# ------------------------ ccache ------------------------
+
+
+def _parse_ccache_stats(text: str) -> Dict[str, int]:
+    """Hits and misses from ``ccache --print-stats`` (4.x) or ``ccache -s`` (3.x)."""
+
+    stats: Dict[str, int] = {}
+    for line in text.splitlines():
+        parts = line.split("\t")
+        if len(parts) == 2 and parts[1].strip().isdigit():
+            stats[parts[0].strip()] = int(parts[1])
+    if stats:
+        return {
+            "hits": stats.get("direct_cache_hit", 0) + stats.get("preprocessed_cache_hit", 0),
+            "misses": stats.get("cache_miss", 0),
+        }
+
+    hits = misses = 0
+    for line in text.splitlines():
+        m = re.match(r"\s*cache hit \((?:direct|preprocessed)\)\s+(\d+)", line)
+        if m:
+            hits += int(m.group(1))
+        m = re.match(r"\s*cache miss\s+(\d+)", line)
+        if m:
+            misses += int(m.group(1))
+    return {"hits": hits, "misses": misses}
+
+
+def _parse_ccache_stats_log(text: str) -> Dict[str, int]:
+    """Hits and misses from a CCACHE_STATSLOG file: one result per line, "#" lines are headers."""
+
+    hits = misses = 0
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        if "miss" in line:
+            misses += 1
+        elif "hit" in line:
+            hits += 1
+    return {"hits": hits, "misses": misses}
+
+
+def ccache_stats(env: dict) -> Optional[Dict[str, int]]:
+    for args in (["ccache", "--print-stats"], ["ccache", "-s"]):
+        try:
+            out = run_cmd(args, capture_output=True, check=True, env=env)
+        except (subprocess.CalledProcessError, OSError):
+            continue
+        return _parse_ccache_stats(out)
+    return None
+
+
+def configure_ccache(build_env: dict, max_size: str) -> bool:
+    """Route the build's compiler through ccache, if it is installed.
+
+    The cache lives in CCACHE_DIR (default ~/.cache/python_env_setup/ccache),
+    capped at max_size. Each build unpacks its sources into a fresh directory,
+    so paths are made relative to the build's TMPDIR and the working directory
+    is left out of the hash; otherwise nothing would ever hit.
+    """
+
+    if not command_exists("ccache", build_env):
+        print(
+            "ccache not found; install it (e.g. 'sudo apt install ccache' or "
+            "'brew install ccache') to speed up repeated builds."
+        )
+        return False
+
+    build_env.setdefault("CCACHE_DIR", str(cache_dir() / "ccache"))
+    build_env["CCACHE_MAXSIZE"] = max_size
+    build_env["CCACHE_BASEDIR"] = build_env.get("TMPDIR") or tempfile.gettempdir()
+    build_env["CCACHE_NOHASHDIR"] = "1"
+    cc = build_env.get("CC") or "cc"
+    if not cc.startswith("ccache "):
+        build_env["CC"] = f"ccache {cc}"
+    return True
+
+
+def without_ccache(cc: str) -> str:
+    return cc[len("ccache "):] if cc.startswith("ccache ") else cc
+
+
+def report_ccache(
+    build_env: dict, before: Optional[Dict[str, int]], *, stats_log: Optional[str] = None, shared: bool = False
+) -> None:
+    """Print the build's ccache hit rate.
+
+    stats_log is this build's own CCACHE_STATSLOG, if it could be given one.
+    Without it, the figures are the change in ccache's global counters, which
+    includes any other build that ran at the same time (shared).
+    """
+
+    scope = "compilations"
+    counts = None
+    if stats_log is not None:
+        counts = _parse_ccache_stats_log(_read_proc(stats_log))
+        with contextlib.suppress(OSError):
+            os.unlink(stats_log)
+    if not counts or not counts["hits"] + counts["misses"]:
+        after = ccache_stats(build_env)
+        if before is None or after is None:
+            return
+        counts = {key: after[key] - before[key] for key in ("hits", "misses")}
+        if shared:
+            scope = "compilations of all builds running at the time"
+    hits, total = counts["hits"], counts["hits"] + counts["misses"]
+    if total <= 0:
+        return
+    print(
+        f"ccache: {hits} of {total} {scope} served from cache "
+        f"({100.0 * hits / total:.1f}% hit rate; cache in {build_env['CCACHE_DIR']}, "
+        f"limit {build_env['CCACHE_MAXSIZE']})."
+    )
+
+
+# ------------------------ prebuilt interpreter cache ------------------------
+
+
+class BuildOptions(NamedTuple):
+    """How ensure_version_installed should build (or fetch) an interpreter."""
+
+    binary_cache: bool = True
+    ccache: bool = True
+    ccache_size: str = "5G"
+    benchmark: bool = True
+    optimized: bool = False
+    pgo_workload: Optional[str] = None
+    jit: bool = False
+    native: bool = False
+    bolt: bool = False
+    frame_pointers: bool = False
+    dtrace: bool = False
+    slim: bool = False
+    # Strip binaries and drop test suites and static libraries after installing.
+    prune: bool = False
+    # Precompile bytecode after installing, with this invalidation mode.
+    precompile: Optional[str] = None
+    # Build in a RAM-backed tmpfs when there is enough memory to spare.
+    tmpfs: bool = True
+    # One of BUILD_CONFIGURATIONS, e.g. the winner of a --build-matrix run.
+    config: Optional[str] = None
+
+
+# The BuildOptions fields that select a build variant, at their default values.
+DEFAULT_VARIANT_OPTIONS = {
+    "optimized": False,
+    "pgo_workload": None,
+    "jit": False,
+    "native": False,
+    "bolt": False,
+    "frame_pointers": False,
+    "dtrace": False,
+    "slim": False,
+    "config": None,
+}
+
+
+# Environment variables that change what python-build produces. Job counts
+# and temp dirs are deliberately absent: they don't change the result.
+BUILD_ENV_KEYS = (
+    "PYTHON_CONFIGURE_OPTS",
+    "CONFIGURE_OPTS",
+    "PYTHON_CFLAGS",
+    "CFLAGS",
+    "CPPFLAGS",
+    "LDFLAGS",
+    "PYTHON_LDFLAGS",
+    "PYTHON_CPPFLAGS",
+    "PYTHON_MAKE_OPTS",
+    "CC",
+    "PROFILE_TASK",
+)
+
+
+def os_release() -> str:
+    if sys.platform == "darwin":
+        return "macos-" + platform.mac_ver()[0]
+    fields = {}
+    for line in _read_proc("/etc/os-release").splitlines():
+        key, _, value = line.partition("=")
+        fields[key] = value.strip().strip('"')
+    return f"{fields.get('ID', platform.system().lower())}-{fields.get('VERSION_ID', platform.release())}"
+
+
+def libc_version() -> str:
+    try:
+        return os.confstr("CS_GNU_LIBC_VERSION") or ""
+    except (AttributeError, ValueError, OSError):
+        return " ".join(platform.libc_ver())
+
+
+def compiler_identity(build_env: dict) -> str:
+    """First line of ``$CC --version`` (``cc`` by default)."""
+
+    cc = without_ccache(build_env.get("CC") or "cc").split()
+    try:
+        out = run_cmd(cc + ["--version"], capture_output=True, check=True, env=build_env)
+    except (subprocess.CalledProcessError, OSError):
+        return " ".join(cc) + " (unknown)"
+    return out.splitlines()[0].strip() if out else " ".join(cc)
+
+
+def build_fingerprint(version: str, name: str, build_env: dict, variant_info: Optional[dict] = None) -> dict:
+    """Everything a finished ``$PYENV_ROOT/versions/<name>`` tree depends on."""
+
+    catalog = load_version_catalog(build_env) or {}
+    entry = catalog.get(version)
+    return {
+        "version": version,
+        "name": name,
+        "source_sha256": entry.sha256 if entry else None,
+        "build_env": {
+            k: without_ccache(build_env[k]) if k == "CC" else build_env[k]
+            for k in BUILD_ENV_KEYS
+            if build_env.get(k)
+        },
+        "compiler": compiler_identity(build_env),
+        "libc": libc_version(),
+        "os": os_release(),
+        "machine": platform.machine(),
+        "variant": variant_info or {},
+        # The install prefix is baked into the interpreter.
+        "prefix": str(pyenv_root(build_env) / "versions" / name),
+    }
+
+
+def fingerprint_key(fingerprint: dict) -> str:
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def interpreter_cache_dir() -> Path:
+    return cache_dir() / "interpreters"
+
+
+def restore_cached_interpreter(fingerprint: dict, env: dict) -> bool:
+    """Unpack a cached build into ``$PYENV_ROOT/versions``; False on a cache miss."""
+
+    key = fingerprint_key(fingerprint)
+    archive = interpreter_cache_dir() / f"{key}.tar.gz"
+    if not archive.is_file():
+        return False
+
+    target = Path(fingerprint["prefix"])
+    staging = target.with_name(f".{target.name}.restore-{os.getpid()}")
+    print(f"Restoring Python {fingerprint['name']} from the binary cache ({archive.name})...")
+    started = time.monotonic()
+    try:
+        with TRACER.span("restore cached interpreter", cat="cache", key=key):
+            staging.mkdir(parents=True)
+            with tarfile.open(str(archive), "r:gz") as tar:
+                if hasattr(tarfile, "tar_filter"):
+                    tar.extractall(str(staging), filter="tar")
+                else:
+                    tar.extractall(str(staging))
+            os.rename(str(staging), str(target))
+    except (OSError, tarfile.TarError) as e:
+        print(f"Could not restore the cached build ({e}); building from source instead.")
+        shutil.rmtree(str(staging), ignore_errors=True)
+        return False
+
+    try:
+        run_cmd(["pyenv", "rehash"], check=True, env=env)
+    except subprocess.CalledProcessError:
+        pass
+    print(f"Restored in {time.monotonic() - started:.1f}s.")
+    return True
+
+
+def store_interpreter(fingerprint: dict) -> None:
+    """Archive a freshly built ``versions/<name>`` tree under its fingerprint key."""
+
+    key = fingerprint_key(fingerprint)
+    cache = interpreter_cache_dir()
+    archive = cache / f"{key}.tar.gz"
+    if archive.is_file():
+        return
+    source = Path(fingerprint["prefix"])
+    tmp = cache / f".{key}.{os.getpid()}.tmp"
+    started = time.monotonic()
+    try:
+        with TRACER.span("store interpreter", cat="cache", key=key):
+            cache.mkdir(parents=True, exist_ok=True)
+            with tarfile.open(str(tmp), "w:gz", compresslevel=6) as tar:
+                tar.add(str(source), arcname=".")
+            os.replace(str(tmp), str(archive))
+    except (OSError, tarfile.TarError) as e:
+        print(f"Could not add Python {fingerprint['name']} to the binary cache: {e}")
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return
+
+    meta = dict(fingerprint, key=key, archive_bytes=archive.stat().st_size, created=int(time.time()))
+    _save_json(cache / f"{key}.json", meta)
+    print(
+        f"Stored Python {fingerprint['name']} in the binary cache "
+        f"({archive.stat().st_size / (1024 * 1024):.0f} MB, {time.monotonic() - started:.1f}s)."
+    )
+
+
+# ------------------------ build variants ------------------------
+
+
+class BuildVariant:
+    """Configure options and compiler flags that set a build apart from pyenv's default.
+
+    Non-default variants are installed next to the default build under a
+    suffixed name, e.g. ``3.12.4-opt``, so both can be compared.
+    """
+
+    __slots__ = ("tags", "configure_opts", "cflags", "ldflags", "make_opts", "env", "mb_per_job", "info")
+
+    def __init__(self) -> None:
+        self.tags: List[str] = []
+        self.configure_opts: List[str] = []
+        self.cflags: List[str] = []
+        self.ldflags: List[str] = []
+        self.make_opts: List[str] = []
+        self.env: Dict[str, str] = {}
+        self.mb_per_job = MB_PER_BUILD_JOB
+        # Anything else that identifies the build; goes into the binary cache key.
+        self.info: Dict[str, object] = {}
+
+    @property
+    def profile(self) -> str:
+        return "-".join(self.tags) or "default"
+
+    def install_name(self, version: str) -> str:
+        return "-".join([version] + self.tags)
+
+    @property
+    def changes_speed(self) -> bool:
+        """Whether the variant is expected to run faster or slower than the default build."""
+
+        return any(tag not in SPEED_NEUTRAL_TAGS for tag in self.tags)
+
+    def apply(self, build_env: dict) -> None:
+        """Add this variant's settings to the environment python-build runs in."""
+
+        for key, values in (
+            ("PYTHON_CONFIGURE_OPTS", self.configure_opts),
+            ("PYTHON_CFLAGS", self.cflags),
+            ("PYTHON_LDFLAGS", self.ldflags),
+            ("PYTHON_MAKE_OPTS", self.make_opts),
+        ):
+            if values:
+                build_env[key] = " ".join(([build_env[key]] if build_env.get(key) else []) + values)
+        build_env.update(self.env)
+
+
+# Variant tags that only change what gets installed, not how fast it runs.
+SPEED_NEUTRAL_TAGS = {"slim"}
+
+# LTO links need far more memory per job than plain compiles.
+MB_PER_LTO_JOB = 1200
+
+
+def pgo_workload_info(path: str) -> dict:
+    """Check a PGO training script and describe it for the binary cache key.
+
+    CPython's Makefile runs ``./python $(PROFILE_TASK)`` from the build tree
+    and ignores its exit status, so a broken script would silently leave the
+    build trained on nothing. Catch what can be caught up front.
+    """
+
+    script = Path(path).expanduser().resolve()
+    if not script.is_file():
+        raise ValueError(f"PGO workload {path} is not a file")
+    if re.search(r"\s", str(script)):
+        # PROFILE_TASK is passed through make, which splits it on whitespace.
+        raise ValueError(f"PGO workload path {script} must not contain whitespace")
+    source = script.read_bytes()
+    try:
+        compile(source, str(script), "exec")
+    except (SyntaxError, ValueError) as e:
+        raise ValueError(f"PGO workload {script} does not compile: {e}")
+    return {"path": str(script), "sha256": hashlib.sha256(source).hexdigest()}
+
+
+# The configurations --build-matrix compares, each on top of pyenv's defaults.
+# "-fno-semantic-interposition" lets the compiler inline calls between
+# libpython's own exported functions. From 3.10, configure adds it to every
+# --enable-optimizations build, so "pgo-lto" turns it back off to remain the
+# "without" side of the comparison.
+_PGO_LTO = ["--enable-optimizations", "--with-lto"]
+BUILD_CONFIGURATIONS: Dict[str, dict] = {
+    "default": {},
+    "pgo": {"configure_opts": ["--enable-optimizations"]},
+    "pgo-lto": {"configure_opts": _PGO_LTO, "semantic_interposition": True},
+    "pgo-lto-nosi": {
+        "configure_opts": _PGO_LTO,
+        "cflags": ["-fno-semantic-interposition"],
+        "ldflags": ["-fno-semantic-interposition"],
+    },
+    "clang": {"cc": "clang"},
+    "pgo-lto-clang": {"configure_opts": _PGO_LTO, "cc": "clang"},
+}
+
+
+def build_variant(version: str, options: BuildOptions) -> BuildVariant:
+    """Translate the build options into a BuildVariant for version."""
+
+    variant = BuildVariant()
+    if options.config and options.config != "default":
+        config = BUILD_CONFIGURATIONS[options.config]
+        variant.tags.append(options.config)
+        variant.configure_opts += config.get("configure_opts", [])
+        variant.cflags += config.get("cflags", [])
+        variant.ldflags += config.get("ldflags", [])
+        if config.get("cc"):
+            variant.env["CC"] = config["cc"]
+        if config.get("semantic_interposition") and tuple(int(x) for x in version.split(".")[:2]) >= (3, 10):
+            # The *_NODIST make variables come after configure's own flags on
+            # the compiler and linker command lines, so the last flag wins.
+            variant.make_opts += [
+                "CFLAGS_NODIST=-fsemantic-interposition",
+                "LDFLAGS_NODIST=-fsemantic-interposition",
+            ]
+        if "--with-lto" in variant.configure_opts:
+            variant.mb_per_job = MB_PER_LTO_JOB
+    if options.optimized or options.pgo_workload or options.bolt:
+        # BOLT reorders an already PGO+LTO-optimized binary.
+        variant.tags.append("opt")
+        variant.configure_opts += ["--enable-optimizations", "--with-lto"]
+        variant.mb_per_job = MB_PER_LTO_JOB
+    if options.pgo_workload:
+        workload = pgo_workload_info(options.pgo_workload)
+        # Name the build after the workload so it sits next to a build trained
+        # on CPython's own test suite.
+        variant.tags.append(re.sub(r"[^A-Za-z0-9_.]+", "_", Path(workload["path"]).stem))
+        # A make variable on the command line overrides the Makefile's default
+        # (the regression test suite) on every CPython version.
+        variant.make_opts.append(f"PROFILE_TASK={workload['path']}")
+        variant.info["pgo_workload"] = workload
+    if options.bolt:
+        variant.tags.append("bolt")
+        variant.configure_opts.append("--enable-bolt")
+        variant.info["bolt"] = bolt_identity()
+    if options.jit:
+        variant.tags.append("jit")
+        variant.configure_opts.append("--enable-experimental-jit")
+        variant.info["jit_llvm"] = jit_llvm_version(version)
+    if options.frame_pointers:
+        # Lets perf and other native profilers unwind through the interpreter.
+        variant.tags.append("fp")
+        variant.cflags += ["-fno-omit-frame-pointer", "-mno-omit-leaf-frame-pointer"]
+    if options.dtrace:
+        # USDT probes (function entry/return, GC start/done, ...) for DTrace
+        # and SystemTap/bpftrace; they cost a branch each while nothing traces.
+        variant.tags.append("dtrace")
+        variant.configure_opts.append("--with-dtrace")
+    if options.slim:
+        variant.tags.append("slim")
+        minor = tuple(int(x) for x in version.split(".")[:2])
+        if minor >= (3, 10):
+            variant.configure_opts.append("--disable-test-modules")
+        if minor >= (3, 11):
+            # Older versions can only be kept from building _tkinter by
+            # missing Tk headers; remove_slim_extras deletes it afterwards.
+            variant.configure_opts.append("py_cv_module__tkinter=n/a")
+        # Keeps python-build from warning that tkinter is missing.
+        variant.env["DISPLAY"] = ""
+    if options.prune:
+        # Pruning keeps the install name but changes the tree that is cached.
+        variant.info["pruned"] = PRUNE_FORMAT
+    if options.native:
+        features = cpu_features()
+        march = native_march(variant.env.get("CC") or os.environ.get("CC") or "cc")
+        variant.tags.append(f"native-{march}" if march else "native")
+        variant.cflags += ["-march=native", "-mtune=native"]
+        # The exact feature set goes into the binary cache key, so a tuned
+        # build is never restored onto a CPU that lacks an instruction it uses.
+        variant.info["cpu"] = {"model": cpu_model(), "march": march, "features": features}
+        # ccache only sees the literal "-march=native"; make it hash the
+        # features too, in case its cache directory is shared between hosts.
+        variant.env["CCACHE_EXTRAFILES"] = str(cpu_features_file(features))
+    return variant
+
+
+def cpu_features() -> List[str]:
+    """The CPU's feature flags: /proc/cpuinfo on Linux, sysctl on macOS."""
+
+    for line in _read_proc("/proc/cpuinfo").splitlines():
+        key, _, value = line.partition(":")
+        # "flags" on x86, "Features" on ARM.
+        if key.strip() in ("flags", "Features"):
+            return sorted(set(value.split()))
+    if sys.platform == "darwin":
+        try:
+            out = run_cmd(
+                ["sysctl", "-n", "machdep.cpu.brand_string", "machdep.cpu.features", "machdep.cpu.leaf7_features"],
+                capture_output=True,
+                check=False,
+            )
+        except OSError:
+            out = ""
+        return sorted(set((out or "").lower().split()))
+    return []
+
+
+def cpu_features_file(features: List[str]) -> Path:
+    """A file listing features, named after their hash, for ccache to hash."""
+
+    text = "\n".join(features) + "\n"
+    path = cache_dir() / "cpu" / f"features-{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}.txt"
+    if not path.is_file():
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(text, encoding="utf-8")
+        except OSError:
+            pass
+    return path
+
+
+@functools.lru_cache(maxsize=None)
+def native_march(cc: str) -> Optional[str]:
+    """What -march=native resolves to (e.g. "skylake"), if the compiler says."""
+
+    try:
+        # GCC only; clang has no equivalent query and yields None.
+        out = run_cmd(
+            without_ccache(cc).split() + ["-march=native", "-Q", "--help=target"],
+            capture_output=True,
+            check=True,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    m = re.search(r"^\s*-march=\s*([\w.-]+)\s*$", out or "", re.M)
+    return m.group(1) if m and m.group(1) != "native" else None
+
+
+# The LLVM major version CPython's JIT build (Tools/jit) requires, per minor
+# version. Later versions are assumed to need the newest one listed.
+JIT_LLVM_VERSIONS = {(3, 13): 18, (3, 14): 19}
+JIT_LLVM_TOOLS = ("clang", "llvm-objdump", "llvm-readobj")
+
+
+def jit_llvm_version(version: str) -> Optional[int]:
+    """LLVM major version needed to build version with the JIT; None if it has none."""
+
+    minor = tuple(int(x) for x in version.split(".")[:2])
+    if minor < min(JIT_LLVM_VERSIONS):
+        return None
+    return JIT_LLVM_VERSIONS.get(minor, JIT_LLVM_VERSIONS[max(JIT_LLVM_VERSIONS)])
+
+
+def find_llvm_tool(tool: str, llvm_version: int, env: dict) -> Optional[str]:
+    """Locate an LLVM tool of the given major version the way Tools/jit does."""
+
+    path = env.get("PATH")
+    candidates = [shutil.which(f"{tool}-{llvm_version}", path=path), shutil.which(tool, path=path)]
+    prefix_queries = []
+    llvm_config = shutil.which(f"llvm-config-{llvm_version}", path=path) or shutil.which("llvm-config", path=path)
+    if llvm_config:
+        prefix_queries.append([llvm_config, "--bindir"])
+    if shutil.which("brew", path=path):
+        prefix_queries.append(["brew", "--prefix", f"llvm@{llvm_version}"])
+    for query in prefix_queries:
+        try:
+            prefix = run_cmd(query, capture_output=True, check=True, env=env).strip()
+        except (subprocess.CalledProcessError, OSError):
+            continue
+        bindir = prefix if query[-1] == "--bindir" else os.path.join(prefix, "bin")
+        candidates.append(shutil.which(tool, path=bindir))
+    for candidate in candidates:
+        if candidate is None:
+            continue
+        try:
+            out = run_cmd([candidate, "--version"], capture_output=True, check=True, env=env)
+        except (subprocess.CalledProcessError, OSError):
+            continue
+        if re.search(rf"version {llvm_version}\.\d+", out or ""):
+            return candidate
+    return None
+
+
+# BOLT support (--enable-bolt) was added to configure in 3.12.
+BOLT_MIN_VERSION = (3, 12)
+BOLT_TOOLS = ("llvm-bolt", "merge-fdata")
+
+
+def find_bolt_tool(tool: str, env: dict) -> Optional[str]:
+    """A BOLT tool on PATH or in LLVM's bindir, as configure searches for it."""
+
+    path = env.get("PATH")
+    found = shutil.which(tool, path=path)
+    if found is None and shutil.which("llvm-config", path=path):
+        try:
+            bindir = run_cmd(["llvm-config", "--bindir"], capture_output=True, check=True, env=env).strip()
+        except (subprocess.CalledProcessError, OSError):
+            return None
+        found = shutil.which(tool, path=bindir)
+    return found
+
+
+def bolt_identity() -> Optional[str]:
+    """The first line of ``llvm-bolt --version`` that names a version."""
+
+    tool = find_bolt_tool("llvm-bolt", os.environ)
+    if tool is None:
+        return None
+    try:
+        out = run_cmd([tool, "--version"], capture_output=True, check=True)
+    except (subprocess.CalledProcessError, OSError):
+        return tool
+    for line in (out or "").splitlines():
+        if "version" in line.lower():
+            return line.strip()
+    return tool
+
+
+def check_build_toolchain(version: str, variant: BuildVariant, env: dict) -> List[str]:
+    """Problems that would make variant's build fail part way; empty if none."""
+
+    problems = []
+    if "--enable-bolt" in variant.configure_opts:
+        if tuple(int(x) for x in version.split(".")[:2]) < BOLT_MIN_VERSION:
+            problems.append(f"BOLT builds need Python 3.12 or later, not {version}")
+        if not sys.platform.startswith("linux"):
+            problems.append("BOLT builds are only supported on Linux")
+        missing = [tool for tool in BOLT_TOOLS if find_bolt_tool(tool, env) is None]
+        if missing:
+            problems.append(
+                f"the BOLT build needs {' and '.join(missing)} from LLVM "
+                "(e.g. 'sudo apt install bolt-18' on Ubuntu)"
+            )
+    llvm = variant.info.get("jit_llvm")
+    if llvm is not None:
+        missing = [tool for tool in JIT_LLVM_TOOLS if find_llvm_tool(tool, llvm, env) is None]
+        if missing:
+            if sys.platform == "darwin":
+                hint = f"brew install llvm@{llvm}"
+            else:
+                hint = f"sudo apt install clang-{llvm} llvm-{llvm}"
+            problems.append(
+                f"the JIT build of Python {version} needs LLVM {llvm} ({', '.join(missing)} not found; try: {hint})"
+            )
+    if "--with-dtrace" in variant.configure_opts:
+        if not command_exists("dtrace", env):
+            problems.append(
+                "the dtrace build needs the dtrace command (on Ubuntu: sudo apt install systemtap-sdt-dev)"
+            )
+        elif sys.platform.startswith("linux") and not has_c_header("sys/sdt.h", env):
+            problems.append("the dtrace build needs <sys/sdt.h> (on Ubuntu: sudo apt install systemtap-sdt-dev)")
+    cc = variant.env.get("CC")
+    if cc and not command_exists(cc, env):
+        problems.append(f"the compiler {cc} is not installed")
+    elif cc == "clang":
+        # configure aborts without these rather than building something else.
+        needed = []
+        if "--enable-optimizations" in variant.configure_opts:
+            needed.append(("PGO", "llvm-profdata"))
+        if "--with-lto" in variant.configure_opts:
+            needed.append(("LTO", "llvm-ar"))
+        for feature, tool in needed:
+            if not find_clang_tool(tool, env):
+                problems.append(
+                    f"{feature} with clang needs {tool}, which was not found (on Ubuntu: sudo apt install llvm)"
+                )
+    return problems
+
+
+def has_c_header(header: str, env: dict) -> bool:
+    """Whether the C compiler can find header (it is only preprocessed)."""
+
+    cc = without_ccache(env.get("CC") or "cc").split()
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "check.c")
+        with open(source, "w", encoding="utf-8") as f:
+            f.write(f"#include <{header}>\n")
+        try:
+            run_cmd(cc + ["-E", source, "-o", os.devnull], capture_output=True, check=True, env=env)
+        except (subprocess.CalledProcessError, OSError):
+            return False
+    return True
+
+
+def ubuntu_build_deps(options: BuildOptions) -> List[str]:
+    """The apt packages to install for builds made with options."""
+
+    packages = list(UBUNTU_BUILD_DEPS)
+    if options.dtrace:
+        packages.append("systemtap-sdt-dev")
+    if options.slim:
+        packages.remove("tk-dev")
+    return packages
+
+
+def find_clang_tool(tool: str, env: dict) -> Optional[str]:
+    """An LLVM tool such as llvm-profdata or llvm-ar on PATH or next to clang, where CPython's configure looks."""
+
+    path = env.get("PATH")
+    clang = shutil.which("clang", path=path)
+    search = os.pathsep.join(p for p in (path, os.path.dirname(os.path.realpath(clang)) if clang else None) if p)
+    return shutil.which(tool, path=search)
+
+
+# What a slim build leaves out of lib/pythonX.Y; --disable-test-modules only
+# exists from 3.10, so test/ is removed by hand for older versions. Before
+# 3.11, setup.py builds _tkinter whenever the Tk headers are installed, so the
+# extension is removed by hand too.
+SLIM_LIB_ENTRIES = ("idlelib", "tkinter", "turtledemo", "turtle.py", "test", "lib-dynload/_tkinter*")
+
+
+def remove_slim_extras(prefix: str) -> int:
+    """Delete IDLE, tkinter and the test suite from an installed tree; returns bytes freed."""
+
+    root = Path(prefix)
+    targets = [p for lib in root.glob("lib/python3*") for e in SLIM_LIB_ENTRIES for p in lib.glob(e)]
+    targets += list(root.glob("bin/idle*"))
+    freed = 0
+    for target in targets:
+        if target.is_symlink() or target.is_file():
+            freed += target.lstat().st_size
+            target.unlink()
+        elif target.is_dir():
+            freed += tree_size(str(target))
+            shutil.rmtree(str(target), ignore_errors=True)
+    return freed
+
+
+def report_slim_savings(version: str, installed_bytes: int, baseline_profile: str) -> None:
+    baseline = typical_build_value(version, baseline_profile, "bytes")
+    minor = ".".join(version.split(".")[:2])
+    mb = installed_bytes / (1024 * 1024)
+    if baseline is None:
+        print(f"The slim install takes {mb:.0f} MB; no full build of {minor} has been recorded to compare against.")
+        return
+    saved = baseline - installed_bytes
+    print(
+        f"The slim install takes {mb:.0f} MB, {saved / (1024 * 1024):.0f} MB ({saved * 100 / baseline:.0f}%) "
+        f"less than a {baseline_profile} build of {minor} on this host."
+    )
+
+
+def python_build_command(version: str, name: str, env: dict) -> List[str]:
+    """The command that builds definition version into ``versions/<name>``.
+
+    ``pyenv install`` can only install a definition under its own name, so
+    other names go through python-build directly.
+    """
+
+    if name == version:
+        return ["pyenv", "install", version]
+    python_build = shutil.which("python-build", path=env.get("PATH"))
+    definitions = find_python_build_dir(env)
+    if definitions is not None:
+        candidate = definitions.parent.parent / "bin" / "python-build"
+        if candidate.is_file():
+            python_build = str(candidate)
+    if python_build is None:
+        raise FileNotFoundError("python-build was not found next to pyenv")
+    return [python_build, version, str(pyenv_root(env) / "versions" / name)]
+
+
+def use_source_cache(version: str, env: dict) -> bool:
+    """Keep python-build's downloads in a persistent cache; whether version's sources are already there.
+
+    A build that has to download first isn't a fair timing of the build
+    itself. A PYTHON_BUILD_CACHE_PATH the user set is used as is.
+    """
+
+    if not env.get("PYTHON_BUILD_CACHE_PATH"):
+        path = cache_dir() / "python-build-sources"
+        try:
+            path.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            return False
+        env["PYTHON_BUILD_CACHE_PATH"] = str(path)
+    base = version[:-1] if is_free_threaded(version) else version
+    return any(Path(env["PYTHON_BUILD_CACHE_PATH"]).glob(f"Python-{base}.t*"))
+
+
+def typical_build_value(version: str, profile: str, field: str = "seconds", **match) -> Optional[float]:
+    """Median recorded field (e.g. build seconds) of this minor version and profile on this host.
+
+    match narrows the records further, e.g. ``location="tmpfs"``.
+    """
+
+    minor = ".".join(version.split(".")[:2])
+    host = host_signature()
+    values = [
+        float(r[field])
+        for r in load_build_history()
+        if r.get("host") == host
+        and r.get("profile", "default") == profile
+        and ".".join(str(r.get("version", "")).split(".")[:2]) == minor
+        and r.get(field)
+        and not r.get("failed")
+        and all(r.get(k) == v for k, v in match.items())
+    ]
+    return statistics.median(values) if values else None
+
+
+def report_build_time(
+    version: str, variant: BuildVariant, seconds: float, baseline_profile: str = "default"
+) -> None:
+    """Compare a variant's build time with the recorded builds of baseline_profile."""
+
+    if variant.profile == baseline_profile:
+        return
+    baseline = typical_build_value(version, baseline_profile)
+    minor = ".".join(version.split(".")[:2])
+    if baseline is None:
+        print(
+            f"The {variant.profile} build took {seconds:.0f}s; no {baseline_profile} build of {minor} "
+            "has been recorded on this host yet to compare against."
+        )
+        return
+    print(
+        f"The {variant.profile} build took {seconds:.0f}s, {seconds - baseline:+.0f}s "
+        f"({seconds / max(baseline, 1e-6):.1f}x) compared with a {baseline_profile} build of {minor} "
+        f"on this host ({baseline:.0f}s)."
+    )
+
+
+# ------------------------ post-install pruning ------------------------
+
+
+# Bump when prune_interpreter removes something new, so pruned builds in the
+# binary cache are keyed apart from older ones.
+PRUNE_FORMAT = 1
+PRUNE_MANIFEST = ".python_env_setup-prune.json"
+# Test suites in the standard library (not in site-packages).
+PRUNED_TEST_DIRS = {"test", "tests", "idle_test"}
+
+
+def _is_elf(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == b"\x7fELF"
+    except OSError:
+        return False
+
+
+def _strip_candidates(root: Path) -> List[str]:
+    """ELF executables and shared objects under bin/ and lib/ (symlinks skipped).
+
+    site-packages is left alone: third-party wheels bundle libraries that
+    auditwheel/patchelf rewrote, which strip can corrupt.
+    """
+
+    candidates = []
+    for top in ("bin", "lib"):
+        for dirpath, dirnames, filenames in os.walk(str(root / top)):
+            if "site-packages" in dirnames:
+                dirnames.remove("site-packages")
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if (top == "bin" or ".so" in filename) and not os.path.islink(path) and _is_elf(path):
+                    candidates.append(path)
+    return candidates
+
+
+def prune_interpreter(name: str, variant: BuildVariant, env: dict) -> Optional[dict]:
+    """Strip binaries and remove test suites and static libraries from ``versions/<name>``.
+
+    Every removed path and stripped file is appended to a manifest inside the
+    tree, which travels with it into the binary cache. Frame-pointer builds
+    keep their symbols for the profilers they are meant for.
+    """
+
+    root = pyenv_root(env) / "versions" / name
+    started = time.monotonic()
+    size_before = tree_size(str(root))
+    removed: List[dict] = []
+
+    def remove(path: str) -> None:
+        size = tree_size(path) if os.path.isdir(path) else os.lstat(path).st_size
+        removed.append({"path": os.path.relpath(path, str(root)), "bytes": size})
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            os.unlink(path)
+
+    with TRACER.span("prune interpreter", cat="prune", version=name):
+        for lib in root.glob("lib/python3*"):
+            for dirpath, dirnames, _ in os.walk(str(lib)):
+                if dirpath == str(lib) and "site-packages" in dirnames:
+                    dirnames.remove("site-packages")
+                for dirname in [d for d in dirnames if d in PRUNED_TEST_DIRS]:
+                    remove(os.path.join(dirpath, dirname))
+                    dirnames.remove(dirname)
+        for archive in sorted(root.rglob("libpython*.a")):
+            remove(str(archive))
+
+        stripped: List[dict] = []
+        if "fp" in variant.tags:
+            print(f"Not stripping Python {name}: frame-pointer builds keep their symbols for profiling.")
+        elif not command_exists("strip", env):
+            print("strip not found (it is part of binutils); binaries are left unstripped.")
+        else:
+            candidates = _strip_candidates(root)
+            sizes = {path: os.path.getsize(path) for path in candidates}
+            if candidates:
+                run_cmd(["strip", "--strip-unneeded"] + candidates, check=False, capture_output=True, env=env)
+            for path in candidates:
+                after = os.path.getsize(path)
+                if after != sizes[path]:
+                    stripped.append({"path": os.path.relpath(path, str(root)), "before": sizes[path], "after": after})
+
+    size_after = tree_size(str(root))
+    manifest_path = root / PRUNE_MANIFEST
+    manifest = _load_json(manifest_path)
+    runs = manifest.get("runs") if isinstance(manifest.get("runs"), list) else []
+    run = {
+        "when": int(time.time()),
+        "bytes_before": size_before,
+        "bytes_after": size_after,
+        "removed": removed,
+        "stripped": stripped,
+    }
+    runs.append(run)
+    _save_json(manifest_path, {"format": PRUNE_FORMAT, "runs": runs})
+    mb = 1024 * 1024
+    print(
+        f"Pruned Python {name}: removed {len(removed)} paths and stripped {len(stripped)} binaries, "
+        f"{size_before / mb:.0f} MB -> {size_after / mb:.0f} MB in {time.monotonic() - started:.1f}s "
+        f"(manifest: {manifest_path})."
+    )
+    return run
+
+
+# ------------------------ bytecode precompilation ------------------------
+
+
+# py_compile's PycInvalidationMode names, as compileall's --invalidation-mode takes them.
+INVALIDATION_MODES = ("timestamp", "checked-hash", "unchecked-hash")
+
+# Where an interpreter (or virtualenv) keeps its modules; purelib and platlib
+# are the same directory on most installs.
+_SITE_PATHS_SCRIPT = (
+    "import json, sys, sysconfig; "
+    "print(json.dumps([sysconfig.get_path('stdlib'), sysconfig.get_path('purelib'), "
+    "sysconfig.get_path('platlib'), sys.version_info[:2]]))"
+)
+
+
+def precompile_bytecode(name: str, env: dict, *, mode: str = "timestamp", include_stdlib: bool = True) -> bool:
+    """Compile the .pyc files of ``versions/<name>`` in parallel ahead of the first import.
+
+    Covers the standard library (unless include_stdlib is False, e.g. for a
+    virtualenv whose stdlib is its base interpreter's) and site-packages.
+    Hash-based modes rewrite the timestamp-based .pyc files ``make install``
+    left; unchecked-hash files are never revalidated against their sources,
+    which suits read-only deployments.
+    """
+
+    python = interpreter_path(name, env)
+    try:
+        out = run_cmd([python, "-I", "-c", _SITE_PATHS_SCRIPT], capture_output=True, check=True, env=_bench_env(env))
+        stdlib, purelib, platlib, py_version = json.loads(out.strip().splitlines()[-1])
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"Could not find the module directories of {name}: {e}")
+        return False
+
+    dirs = [d for d in dict.fromkeys(([stdlib] if include_stdlib else []) + [purelib, platlib]) if os.path.isdir(d)]
+    if mode != "timestamp" and tuple(py_version) < (3, 7):
+        print(f"Hash-based .pyc files need Python 3.7+; precompiling {name} with timestamps instead.")
+        mode = "timestamp"
+    cgroup_limit = cgroup_cpu_limit()
+    jobs = max(1, int(min(usable_cpu_count(), cgroup_limit or usable_cpu_count())))
+    cmd = [python, "-I", "-m", "compileall", "-q", "-j", str(jobs)]
+    if tuple(py_version) >= (3, 7):
+        cmd += ["--invalidation-mode", mode]
+    if mode != "timestamp":
+        # compileall skips .pyc files it considers current, whatever their mode.
+        cmd.append("-f")
+    print(f"Precompiling bytecode for {name} ({mode}, {jobs} processes)...")
+    started = time.monotonic()
+    with TRACER.span("precompile bytecode", cat="compileall", version=name, mode=mode):
+        result = run_cmd(cmd + dirs, check=False, env=_bench_env(env))
+    if result.returncode != 0:
+        # compileall exits non-zero when a file (often a test fixture) has a syntax error.
+        print(f"Some files in {name} could not be compiled; the rest were.")
+    print(f"Precompiled {len(dirs)} director{'y' if len(dirs) == 1 else 'ies'} in {time.monotonic() - started:.1f}s.")
+    return True
+
+
+def precompile_environments(name: str, env: dict, *, mode: str = "timestamp") -> None:
+    """Precompile ``versions/<name>`` and the site-packages of every pyenv-virtualenv env based on it."""
+
+    precompile_bytecode(name, env, mode=mode)
+    for record in scan_installed_versions(env):
+        if record.is_virtualenv and record.name.startswith(f"{name}/envs/"):
+            precompile_bytecode(record.name, env, mode=mode, include_stdlib=False)
+
+
+# ------------------------ interpreter benchmarks ------------------------
+
+
+# A short, fixed workload mix: function calls, dict and string handling,
+# float arithmetic and sorting. Each benchmark prints its wall time.
+MICROBENCHMARK_SCRIPT = r"""
+import json, random, time
+
+def calls():
+    def f(a, b):
+        return a + b
+    x = 0
+    for i in range(400000):
+        x = f(x, i)
+
+def dicts():
+    d = {}
+    for i in range(200000):
+        d[str(i)] = i
+    for i in range(200000):
+        d[str(i)] += 1
+
+def strings():
+    parts = []
+    for i in range(100000):
+        parts.append(f"{i}:{i * 2:x}".upper())
+    "-".join(parts).split("-")
+
+def floats():
+    x, y, vx, vy = 0.0, 0.0, 1.0, 0.5
+    for _ in range(300000):
+        r = (x * x + y * y + 1.0) ** 0.5
+        vx -= x / (r * r * r) * 0.01
+        vy -= y / (r * r * r) * 0.01
+        x += vx * 0.01
+        y += vy * 0.01
+
+def sorting():
+    rnd = random.Random(42)
+    data = [rnd.random() for _ in range(200000)]
+    sorted(data)
+    sorted(data, key=lambda v: -v)
+
+results = {}
+for fn in (calls, dicts, strings, floats, sorting):
+    t0 = time.perf_counter()
+    fn()
+    results[fn.__name__] = time.perf_counter() - t0
+print(json.dumps(results))
+"""
+
+
+def interpreter_path(name: str, env: dict) -> str:
+    bin_dir = pyenv_root(env) / "versions" / name / "bin"
+    for exe in ("python3", "python"):
+        if (bin_dir / exe).exists():
+            return str(bin_dir / exe)
+    return str(bin_dir / "python")
+
+
+def has_interpreter(name: str, env: dict) -> bool:
+    """Whether ``versions/<name>`` holds an executable interpreter, not just a directory."""
+
+    return os.access(interpreter_path(name, env), os.X_OK)
+
+
+def _bench_env(env: dict) -> dict:
+    bench_env = dict(env)
+    for key in ("PYTHONPATH", "PYTHONHOME", "PYTHONSTARTUP"):
+        bench_env.pop(key, None)
+    return bench_env
+
+
+def run_microbenchmarks(
+    pythons: List[str], env: dict, *, trials: int = 5, args: Optional[Dict[str, List[str]]] = None
+) -> Dict[str, Dict[str, List[float]]]:
+    """Run the micro-benchmark set trials times per interpreter.
+
+    Interpreters are interleaved trial by trial so that drift in machine load
+    affects all of them alike. Returns {python: {benchmark: [seconds, ...]}};
+    args optionally adds interpreter options per python (e.g. ``-X perf``).
+    """
+
+    bench_env = _bench_env(env)
+    results: Dict[str, Dict[str, List[float]]] = {p: {} for p in pythons}
+    with TRACER.span("microbenchmarks", cat="bench", trials=trials):
+        for _ in range(trials):
+            for python in pythons:
+                extra = (args or {}).get(python, [])
+                out = run_cmd(
+                    [python, "-I"] + extra + ["-c", MICROBENCHMARK_SCRIPT],
+                    capture_output=True,
+                    check=True,
+                    env=bench_env,
+                )
+                for bench, seconds in json.loads(out.strip().splitlines()[-1]).items():
+                    results[python].setdefault(bench, []).append(seconds)
+    return results
+
+
+def geometric_mean(values: List[float]) -> float:
+    return math.exp(sum(math.log(v) for v in values) / len(values)) if values else float("nan")
+
+
+BOOTSTRAP_RESAMPLES = 2000
+
+
+def speedup_interval(
+    baseline: Dict[str, List[float]],
+    candidate: Dict[str, List[float]],
+    *,
+    confidence: float = 0.95,
+    resamples: int = BOOTSTRAP_RESAMPLES,
+) -> Tuple[float, float, float]:
+    """Speedup of candidate over baseline with a bootstrap confidence interval.
+
+    Both map benchmark -> per-trial seconds from run_microbenchmarks. Trials
+    were interleaved, so trial i of both was measured under the same load and
+    the resampling keeps them paired. Returns (speedup, low, high).
+    """
+
+    trials = min(len(times) for times in list(baseline.values()) + list(candidate.values()))
+
+    def speedup(indices) -> float:
+        return geometric_mean(
+            [
+                statistics.median([baseline[b][i] for i in indices])
+                / statistics.median([candidate[b][i] for i in indices])
+                for b in baseline
+            ]
+        )
+
+    point = speedup(range(trials))
+    rnd = random.Random(0)
+    samples = sorted(speedup([rnd.randrange(trials) for _ in range(trials)]) for _ in range(resamples))
+    tail = (1.0 - confidence) / 2
+    return point, samples[int(resamples * tail)], samples[min(resamples - 1, int(resamples * (1.0 - tail)))]
+
+
+def compare_interpreters(
+    baseline: str, candidate: str, env: dict, *, trials: int = 5, candidate_args: Optional[List[str]] = None
+) -> Optional[float]:
+    """Benchmark two installed versions and print a table; returns the speedup.
+
+    The speedup is the geometric mean over benchmarks of baseline / candidate
+    median times, so values above 1.0 mean the candidate is faster.
+    """
+
+    base_py, cand_py = interpreter_path(baseline, env), interpreter_path(candidate, env)
+    shown = " ".join([candidate] + (candidate_args or []))
+    print(f"\nBenchmarking {shown} against {baseline} ({trials} trials each)...")
+    try:
+        results = run_microbenchmarks(
+            [base_py, cand_py], env, trials=trials, args={cand_py: candidate_args or []}
+        )
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"Benchmark failed: {e}")
+        return None
+
+    width = max(len(baseline), len(candidate), 10)
+    print(f"  {'benchmark':<12} {baseline:>{width}} {candidate:>{width}}  speedup")
+    ratios = []
+    for bench, base_times in results[base_py].items():
+        base = statistics.median(base_times)
+        cand = statistics.median(results[cand_py][bench])
+        ratios.append(base / cand)
+        print(f"  {bench:<12} {base * 1000:>{width - 3}.1f} ms {cand * 1000:>{width - 3}.1f} ms  {base / cand:6.2f}x")
+    speedup = geometric_mean(ratios)
+    print(f"  {'geo. mean':<12} {'':>{width}} {'':>{width}}  {speedup:6.2f}x")
+    return speedup
+
+
+# Instruction-cache and iTLB pressure, which BOLT's code layout targets.
+ICACHE_EVENTS = ("instructions", "L1-icache-load-misses", "iTLB-load-misses")
+
+
+def perf_stat(python: str, env: dict) -> Optional[Dict[str, float]]:
+    """Hardware counters for one micro-benchmark run under ``perf stat``."""
+
+    fd, out_file = tempfile.mkstemp(prefix="perf-stat-", suffix=".csv")
+    os.close(fd)
+    try:
+        run_cmd(
+            ["perf", "stat", "-x,", "-o", out_file, "-e", ",".join(ICACHE_EVENTS), "--"]
+            + [python, "-I", "-c", MICROBENCHMARK_SCRIPT],
+            capture_output=True,
+            check=True,
+            env=_bench_env(env),
+        )
+        with open(out_file, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    finally:
+        os.unlink(out_file)
+    counts: Dict[str, float] = {}
+    for line in lines:
+        fields = line.split(",")
+        # value,unit,event,...; unsupported counters read "<not supported>".
+        if len(fields) >= 3 and fields[2] in ICACHE_EVENTS:
+            try:
+                counts[fields[2]] = float(fields[0])
+            except ValueError:
+                pass
+    return counts if counts.get("instructions") else None
+
+
+def compare_icache(baseline: str, candidate: str, env: dict) -> None:
+    """Print i-cache and iTLB misses per thousand instructions of two builds."""
+
+    if not command_exists("perf", env):
+        print("Install Linux perf to compare instruction-cache misses as well.")
+        return
+    stats = {name: perf_stat(interpreter_path(name, env), env) for name in (baseline, candidate)}
+    if not all(stats.values()):
+        print("perf could not read the hardware counters (check kernel.perf_event_paranoid).")
+        return
+    print(f"  {'misses per 1k instructions':<28} {baseline:>16} {candidate:>16}")
+    for event in ICACHE_EVENTS[1:]:
+        row = [stats[n].get(event) for n in (baseline, candidate)]
+        if None in row:
+            continue
+        mpki = [count * 1000 / stats[n]["instructions"] for count, n in zip(row, (baseline, candidate))]
+        print(f"  {event:<28} {mpki[0]:>16.3f} {mpki[1]:>16.3f}")
+
+
+# ------------------------ version selection & installation ------------------------
+
+
+def list_available_versions(env: dict) -> List[str]:
+    catalog = load_version_catalog(env)
+    if catalog is not None:
+        versions = list(catalog)
+        if not versions:
+            print("No CPython versions found in python-build's definitions.")
+        return versions
+
+    # python-build's definitions weren't found where we expected them; fall
+    # back to asking pyenv.
+    print("\nRetrieving available CPython versions from pyenv (this may take a few seconds)...")
+    try:
+        out = cached_pyenv_query(["install", "--list"], env)
+    except subprocess.CalledProcessError as e:
+        print("Failed to list versions from pyenv:", e)
+        return []
+
+    versions: list[str] = []
+    for line in out.splitlines():
+        v = line.strip()
+        if CPYTHON_VERSION_RE.fullmatch(v):
+            versions.append(v)
+
+    if not versions:
+        print("No CPython versions found in pyenv output.")
+    return versions
+
+
+@traced
+def prompt_for_version(env: dict, versions: Optional[List[str]] = None) -> Optional[str]:
+    if versions is None:
+        versions = list_available_versions(env)
+    if not versions:
+        return None
+
+    index = VersionIndex(versions)
+
+    # Show the newest patch release of the 15 most recent minor versions,
+    # followed by the free-threaded builds
+    latest = index.latest_per_minor()[-15:]
+    free_threaded = index.latest_per_minor(free_threaded=True)
+    print("\nSelect a Python version to install:")
+    for i, v in enumerate(latest, start=1):
+        print(f"  {i:2d}) {v}")
+    if free_threaded:
+        print("  Free-threaded (no GIL):")
+        for i, v in enumerate(free_threaded, start=len(latest) + 1):
+            print(f"  {i:2d}) {v}")
+    latest += free_threaded
+
+    print(
+        "\nYou can choose by number, type an exact version (e.g. 3.12.4), or a "
+        "minor version such as 3.12 (or 'latest') for its newest patch release. "
+        "Add a 't' (e.g. 3.13t) for a free-threaded build."
+    )
+
+    while True:
         choice = input("Your choice (or 'q' to quit): ").strip()
         if not choice:
             continue
@@ -446,60 +3380,575 @@ def prompt_for_version(env: dict) -> Optional[str]:
             print("Please enter a number from the list above.")
             continue
         # Exact version
-        if re.fullmatch(r"\d+\.\d+\.\d+", choice):
-            if choice not in versions:
+        if CPYTHON_VERSION_RE.fullmatch(choice):
+            if choice not in index:
                 if ask_yes_no(
-                    f"Version {choice} was not in the recent list, but pyenv may still support it. Try installing it?",
+                    f"Version {choice} was not in the list, but pyenv may still support it. Try installing it?",
                     default=True,
                 ):
                     return choice
                 continue
             return choice
-        print("Please choose a valid number or a version like '3.12.4'.")
+        # Prefix such as 3.12, or 'latest'
+        resolved = index.resolve(choice)
+        if resolved:
+            print(f"'{choice}' resolves to {resolved}.")
+            return resolved
+        print("Please choose a valid number or a version like '3.12.4', '3.12' or '3.13t'.")
 
 
-def ensure_version_installed(version: str, env: dict) -> bool:
-    print(f"\nChecking if Python {version} is already installed via pyenv...")
+def resolve_version_spec(spec: str, versions: List[str]) -> Optional[str]:
+    """Resolve a --python spec ("3.12", "latest", "3.12.4", "3.13t") against versions."""
+
+    return VersionIndex(versions).resolve(spec)
+
+
+@traced
+def ensure_version_installed(
+    version: str,
+    env: dict,
+    *,
+    label: Optional[str] = None,
+    build_dir: Optional[str] = None,
+    cpu_share: float = 1.0,
+    memory_share: float = 1.0,
+    options: Optional[BuildOptions] = None,
+) -> Optional[str]:
+    """Install version with pyenv unless it is already installed.
+
+    Returns the name it is installed under, which carries a suffix for
+    non-default build variants (e.g. ``3.12.4-opt`` with --optimized), or
+    None on failure. label streams pyenv's output with a prefix, build_dir
+    becomes the build's TMPDIR, and the shares limit the make job count when
+    several builds run side by side (see install_versions_concurrently). With
+    the binary cache enabled, a matching earlier build is restored instead of
+    compiling.
+    """
+
+    options = options or BuildOptions()
+    variant = build_variant(version, options)
+    name = variant.install_name(version)
+
+    if "jit" in variant.tags and variant.info.get("jit_llvm") is None:
+        print(f"The JIT is only available from Python 3.13; {version} can't be built with --jit.")
+        return None
+
+    print(f"\nChecking if Python {name} is already installed via pyenv...")
+    installed = {v.name for v in scan_installed_versions(env)}
+    prefix = pyenv_root(env) / "versions" / name
+    if name in installed and not has_interpreter(name, env) and not prefix.is_symlink():
+        # Left behind by a failed python-build run, e.g. one that failed verify_python after make install.
+        print(f"versions/{name} exists but has no working interpreter; removing it and installing again.")
+        shutil.rmtree(str(prefix), ignore_errors=True)
+    elif name in installed:
+        print(f"Python {name} is already installed.")
+        if options.prune:
+            prune_interpreter(name, variant, env)
+        if options.precompile:
+            precompile_environments(name, env, mode=options.precompile)
+        return name
+
+    build_env = dict(env)
+    variant.apply(build_env)
+    fingerprint = build_fingerprint(version, name, build_env, variant.info) if options.binary_cache else None
+    if fingerprint is not None and restore_cached_interpreter(fingerprint, env):
+        print(f"Python {name} installed from the binary cache.")
+    else:
+        problems = check_build_toolchain(version, variant, build_env)
+        if problems:
+            for problem in problems:
+                print(f"Can't build Python {name}: {problem}.")
+            return None
+        print(f"Python {name} is not installed. Starting installation (this may take a while)...")
+        if not build_interpreter(
+            version,
+            name,
+            variant,
+            build_env,
+            label=label,
+            build_dir=build_dir,
+            cpu_share=cpu_share,
+            memory_share=memory_share,
+            options=options,
+        ):
+            return None
+        if options.prune:
+            # Before archiving, so the binary cache holds the smaller tree.
+            prune_interpreter(name, variant, env)
+        if fingerprint is not None:
+            store_interpreter(fingerprint)
+
+    if is_free_threaded(version) and not verify_free_threading(name, env):
+        return None
+    if "dtrace" in variant.tags:
+        verify_usdt_probes(name, env)
+    if "fp" in variant.tags:
+        if perf_trampoline_supported(version):
+            verify_perf_trampoline(name, env)
+        else:
+            print(
+                f"Python {name} has frame pointers, but -X perf needs Python 3.12+ on Linux "
+                "x86-64/aarch64, so perf will show C frames only."
+            )
+
+    if options.precompile:
+        precompile_environments(name, env, mode=options.precompile)
+    if options.benchmark and variant.changes_speed:
+        benchmark_against_baseline(version, name, env, options)
+    return name
+
+
+def build_interpreter(
+    version: str,
+    name: str,
+    variant: BuildVariant,
+    build_env: dict,
+    *,
+    label: Optional[str],
+    build_dir: Optional[str],
+    cpu_share: float,
+    memory_share: float,
+    options: BuildOptions,
+) -> bool:
+    """Compile version into ``versions/<name>`` and record how long it took."""
+
+    plan = plan_build_jobs(
+        version,
+        cpu_share=cpu_share,
+        memory_share=memory_share,
+        mb_per_job=variant.mb_per_job,
+        profile=variant.profile,
+    )
+    build_env["MAKE_OPTS"] = with_make_jobs(build_env.get("MAKE_OPTS", ""), plan.jobs)
+    if "MAKEOPTS" in build_env:
+        # python-build uses MAKEOPTS instead of MAKE_OPTS when it is set, even to "".
+        build_env["MAKEOPTS"] = with_make_jobs(build_env["MAKEOPTS"], plan.jobs)
+    if build_dir is not None:
+        build_env["TMPDIR"] = build_dir
+    disk_tmpdir = build_env.get("TMPDIR")
+    tmpfs_dir = None
+    if options.tmpfs:
+        tree_mb = MB_BUILD_TREE * (2 if "--with-lto" in variant.configure_opts else 1)
+        tmpfs_dir = make_tmpfs_build_dir(name, tree_mb, plan.jobs * variant.mb_per_job, memory_share)
+        if tmpfs_dir is not None:
+            build_env["TMPDIR"] = tmpfs_dir
+    location = "tmpfs" if tmpfs_dir else "disk"
+    downloaded = not use_source_cache(version, build_env)
+    ccache_before = ccache_log = None
+    if options.ccache and configure_ccache(build_env, options.ccache_size):
+        ccache_before = ccache_stats(build_env)
+        if "CCACHE_STATSLOG" not in build_env:
+            # A log of its own gives this build's hit rate even while others share the cache.
+            fd, ccache_log = tempfile.mkstemp(prefix=f"ccache-{name}-", suffix=".log")
+            os.close(fd)
+            build_env["CCACHE_STATSLOG"] = ccache_log
+    prefix = str(pyenv_root(build_env) / "versions" / name)
+    print(
+        f"Building Python {name} with make -j{plan.jobs} ({plan.reason}) "
+        f"in {build_env.get('TMPDIR') or tempfile.gettempdir()} ({location})."
+    )
+    workload = variant.info.get("pgo_workload")
+    if workload:
+        print(
+            f"The PGO profile will be collected by running {workload['path']} with the "
+            "freshly built interpreter (standard library only, run from the build tree)."
+        )
+    oom_kills_before = cgroup_oom_kills()
+    started = time.monotonic()
     try:
-        out = run_cmd(["pyenv", "versions", "--bare"], capture_output=True, check=True, env=env)
-    except subprocess.CalledProcessError:
-        out = ""
+        try:
+            result = run_cmd(python_build_command(version, name, build_env), check=True, env=build_env, label=label)
+        except subprocess.CalledProcessError:
+            if tmpfs_dir is None or not tmpfs_ran_out(tmpfs_dir):
+                raise
+            print(f"The build ran out of space in tmpfs ({tmpfs_dir}); retrying on disk.")
+            shutil.rmtree(tmpfs_dir, ignore_errors=True)
+            if name != version:
+                # python-build leaves the partly installed prefix behind.
+                shutil.rmtree(prefix, ignore_errors=True)
+            tmpfs_dir, location = None, "disk"
+            if disk_tmpdir is None:
+                build_env.pop("TMPDIR", None)
+            else:
+                build_env["TMPDIR"] = disk_tmpdir
+            if "CCACHE_BASEDIR" in build_env:
+                build_env["CCACHE_BASEDIR"] = disk_tmpdir or tempfile.gettempdir()
+            # The first attempt usually got as far as downloading the sources.
+            downloaded = not use_source_cache(version, build_env)
+            started = time.monotonic()
+            result = run_cmd(python_build_command(version, name, build_env), check=True, env=build_env, label=label)
+        if "slim" in variant.tags:
+            remove_slim_extras(prefix)
+        if name != version:
+            run_cmd(["pyenv", "rehash"], check=False, env=build_env)
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"pyenv failed to install Python {name}: {e}")
+        oom_kills = cgroup_oom_kills()
+        if oom_kills_before is not None and oom_kills is not None and oom_kills > oom_kills_before:
+            # Killed builds never get as far as record_build below, so plan_build_jobs
+            # would pick the same -j again; remember it as memory-bound instead.
+            print(f"The OOM killer stopped processes during the build; make -j{plan.jobs} won't be used again here.")
+            record_build(
+                version,
+                plan.jobs,
+                time.monotonic() - started,
+                memory_bound=True,
+                profile=variant.profile,
+                location=location,
+                failed=True,
+            )
+        if name != version:
+            # Unlike pyenv install, python-build leaves a failed prefix behind.
+            shutil.rmtree(prefix, ignore_errors=True)
+        if tmpfs_dir is not None:
+            move_failed_build(tmpfs_dir, disk_tmpdir or tempfile.gettempdir())
+            tmpfs_dir = None
+        if ccache_log is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(ccache_log)
+        return False
+    finally:
+        if tmpfs_dir is not None:
+            # Give the RAM back; on success python-build has already removed its log and working tree.
+            shutil.rmtree(tmpfs_dir, ignore_errors=True)
+
+    if result.usage is not None:
+        memory_bound = classify_load(result.samples, plan.jobs) == "memory-bound"
+        installed_bytes = tree_size(prefix)
+        record_build(
+            version,
+            plan.jobs,
+            result.usage.wall,
+            memory_bound=memory_bound,
+            profile=variant.profile,
+            bytes=installed_bytes,
+            location=location,
+            downloaded=downloaded,
+        )
+        baseline_profile = build_variant(version, baseline_options(options)).profile
+        report_build_time(version, variant, result.usage.wall, baseline_profile)
+        report_build_location(version, variant.profile, location, result.usage.wall)
+        if "slim" in variant.tags:
+            report_slim_savings(version, installed_bytes, baseline_profile)
+
+    print(f"Python {name} installed successfully via pyenv.")
+    if ccache_before is not None or ccache_log is not None:
+        report_ccache(build_env, ccache_before, stats_log=ccache_log, shared=cpu_share < 1.0)
+    return True
+
+
+# Prints whether the GIL is enabled; sys._is_gil_enabled() exists from 3.13.
+GIL_CHECK_SCRIPT = "import sys; print(getattr(sys, '_is_gil_enabled', lambda: True)())"
 
-    installed = {line.strip() for line in out.splitlines() if line.strip()}
-    if version in installed:
-        print(f"Python {version} is already installed.")
-        return True
 
-    print(f"Python {version} is not installed. Starting installation (this may take a while)...")
+def gil_enabled(python: str, env: dict) -> Optional[bool]:
+    """Whether python runs with the GIL; None if it couldn't be started."""
+
+    check_env = dict(env)
+    # PYTHON_GIL=1 re-enables the GIL on a free-threaded build.
+    check_env.pop("PYTHON_GIL", None)
     try:
-        run_cmd(["pyenv", "install", version], check=True, env=env)
-    except subprocess.CalledProcessError as e:
-        print(f"pyenv failed to install Python {version}: {e}")
+        out = run_cmd([python, "-c", GIL_CHECK_SCRIPT], capture_output=True, check=True, env=check_env)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return out.strip() != "False"
+
+
+def verify_free_threading(name: str, env: dict) -> bool:
+    """Check that an installed free-threaded build really runs without the GIL."""
+
+    enabled = gil_enabled(interpreter_path(name, env), env)
+    if enabled is None:
+        print(f"Could not run Python {name} to check that it is free-threaded.")
+        return False
+    if enabled:
+        print(f"Python {name} was installed, but it runs with the GIL enabled; it is not a free-threaded build.")
+        return False
+    print(f"Python {name} runs without the GIL (sys._is_gil_enabled() is False).")
+    return True
+
+
+def baseline_options(options: BuildOptions) -> BuildOptions:
+    """The build a variant is measured against.
+
+    That is pyenv's default build, except for BOLT, which is measured against
+    the same PGO/LTO build without BOLT so the comparison isolates its effect.
+    """
+
+    if options.bolt:
+        return options._replace(bolt=False, optimized=True, benchmark=False)
+    return options._replace(benchmark=False, **DEFAULT_VARIANT_OPTIONS)
+
+
+def benchmark_against_baseline(version: str, name: str, env: dict, options: BuildOptions) -> Optional[float]:
+    """Compare a variant build with its baseline build of the same version."""
+
+    base_options = baseline_options(options)
+    print(f"\nComparing {name} with a {build_variant(version, base_options).profile} build of Python {version}...")
+    baseline = ensure_version_installed(version, env, options=base_options)
+    if baseline is None:
+        print("The baseline build is not available, so no comparison can be made.")
+        return None
+    speedup = compare_interpreters(baseline, name, env)
+    if options.bolt:
+        compare_icache(baseline, name, env)
+    if options.frame_pointers and perf_trampoline_supported(version):
+        # What profiling in production costs: frame pointers plus the trampoline.
+        before = set(PERF_MAP_DIR.glob("perf-*.map"))
+        compare_interpreters(baseline, name, env, candidate_args=["-X", "perf"])
+        for path in set(PERF_MAP_DIR.glob("perf-*.map")) - before:
+            with contextlib.suppress(OSError):
+                path.unlink()
+    return speedup
+
+
+# CPython writes perf maps to this fixed directory, where perf looks for them,
+# regardless of TMPDIR.
+PERF_MAP_DIR = Path("/tmp")
+
+
+def perf_trampoline_supported(version: str) -> bool:
+    """Whether version has the ``-X perf`` trampoline (3.12+, Linux x86-64/aarch64)."""
+
+    return (
+        tuple(int(x) for x in version.split(".")[:2]) >= (3, 12)
+        and sys.platform.startswith("linux")
+        and platform.machine() in ("x86_64", "aarch64")
+    )
+
+
+_USDT_PROBE_RE = re.compile(r"Provider:\s*python\s+Name:\s*(\S+)")
+
+
+def verify_usdt_probes(name: str, env: dict) -> bool:
+    """Check with readelf that the build's binaries carry Python's USDT probes."""
+
+    if not command_exists("readelf", env):
+        print("readelf not found (it is part of binutils); can't check the build for USDT probes.")
+        return False
+    prefix = pyenv_root(env) / "versions" / name
+    # With --enable-shared the probes live in libpython rather than the executable.
+    binaries = [os.path.realpath(interpreter_path(name, env))] + sorted(
+        str(p) for p in (prefix / "lib").glob("libpython3*.so*") if not p.is_symlink()
+    )
+    probes = set()
+    for binary in binaries:
+        try:
+            out = run_cmd(["readelf", "-n", binary], capture_output=True, check=True, env=env)
+        except (subprocess.CalledProcessError, OSError):
+            continue
+        probes.update(_USDT_PROBE_RE.findall(out or ""))
+    if not probes:
+        print(f"Warning: no USDT probes were found in Python {name}; the dtrace build may not have worked.")
         return False
+    print(f"Python {name} has {len(probes)} USDT probes: {', '.join(sorted(probes))}.")
+    return True
+
+
+PERF_TRAMPOLINE_CHECK = "import os, sys; print(sys.is_stack_trampoline_active(), os.getpid())"
+
 
-    print(f"Python {version} installed successfully via pyenv.")
+def verify_perf_trampoline(name: str, env: dict) -> bool:
+    """Check that ``python -X perf`` activates the trampoline and writes a perf map."""
+
+    try:
+        out = run_cmd(
+            [interpreter_path(name, env), "-X", "perf", "-c", PERF_TRAMPOLINE_CHECK],
+            capture_output=True,
+            check=True,
+            env=_bench_env(env),
+        )
+        active, pid = out.split()
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"Could not run Python {name} with -X perf: {e}")
+        return False
+    perf_map = PERF_MAP_DIR / f"perf-{pid}.map"
+    wrote_map = perf_map.is_file() and perf_map.stat().st_size > 0
+    with contextlib.suppress(OSError):
+        perf_map.unlink()
+    if active != "True" or not wrote_map:
+        print(f"Warning: the -X perf trampoline did not work in Python {name}; perf will not see Python frames.")
+        return False
+    print(f"The -X perf trampoline works in Python {name}; profile it with 'perf record -g python -X perf ...'.")
     return True
 
 
-def maybe_set_global_version(version: str, env: dict) -> None:
-    if ask_yes_no(
+MATRIX_TRIALS = 10
+
+
+def run_build_matrix(version: str, env: dict, options: Optional[BuildOptions] = None) -> Optional[str]:
+    """Build version in every BUILD_CONFIGURATIONS entry and benchmark the builds.
+
+    Configurations whose toolchain is missing are skipped. The fastest one is
+    saved as this host's default configuration if its confidence interval
+    lies entirely above the default build's speed (or cleared if the default
+    build itself wins). Returns the winning configuration.
+    """
+
+    base = (options or BuildOptions())._replace(benchmark=False, **DEFAULT_VARIANT_OPTIONS)
+    names: Dict[str, str] = {}
+    for config in BUILD_CONFIGURATIONS:
+        config_options = base._replace(config=config)
+        problems = check_build_toolchain(version, build_variant(version, config_options), env)
+        if problems:
+            print(f"\nSkipping the {config} configuration: {'; '.join(problems)}.")
+            continue
+        print(f"\n=== Build matrix: {config} ===")
+        name = ensure_version_installed(version, env, options=config_options)
+        if name:
+            names[config] = name
+        else:
+            print(f"The {config} configuration failed to build; leaving it out of the comparison.")
+
+    if "default" not in names or len(names) < 2:
+        print("\nNot enough configurations were built to compare against the default build.")
+        return None
+
+    pythons = {config: interpreter_path(name, env) for config, name in names.items()}
+    print(f"\nBenchmarking {len(names)} builds of Python {version} ({MATRIX_TRIALS} interleaved trials each)...")
+    try:
+        results = run_microbenchmarks(list(pythons.values()), env, trials=MATRIX_TRIALS)
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print(f"Benchmark failed: {e}")
+        return None
+
+    baseline = results[pythons["default"]]
+    rows = []
+    for config, python in pythons.items():
+        times = results[python]
+        geo_ms = geometric_mean([statistics.median(t) for t in times.values()]) * 1000
+        speedup, low, high = speedup_interval(baseline, times)
+        rows.append((speedup, low, high, geo_ms, config))
+    rows.sort(reverse=True)
+
+    print(f"\n  {'configuration':<16} {'geo. mean':>10} {'speedup':>8}  95% CI")
+    for speedup, low, high, geo_ms, config in rows:
+        print(f"  {config:<16} {geo_ms:>7.1f} ms {speedup:>7.3f}x  [{low:.3f}, {high:.3f}]")
+
+    speedup, low, high, _, winner = rows[0]
+    if winner == "default":
+        print("\nThe default build was the fastest; future installs on this host keep pyenv's defaults.")
+        save_host_default("default", version=version)
+        return winner
+    if low <= 1.0:
+        print(
+            f"\n{winner} was fastest ({speedup:.3f}x), but its 95% confidence interval includes "
+            "the default build's speed, so the host default is left unchanged."
+        )
+        return winner
+    print(f"\n{winner} is the fastest configuration on this host ({speedup:.3f}x, 95% CI {low:.3f}-{high:.3f}).")
+    save_host_default(winner, version=version, speedup=round(speedup, 4), ci=[round(low, 4), round(high, 4)])
+    print(
+        f"Future installs on this host will use it (installed as <version>-{winner}); "
+        "pass --no-host-default to opt out."
+    )
+    return winner
+
+
+def install_versions_concurrently(
+    versions: List[str], env: dict, options: Optional[BuildOptions] = None
+) -> Dict[str, Optional[str]]:
+    """Build several versions at once, splitting cores and memory between them.
+
+    Each build gets its own TMPDIR and its output is prefixed with its
+    version. Returns the installed name of each version (None if it failed).
+    """
+
+    options = options or BuildOptions()
+    if options.benchmark:
+        # Benchmarks run next to other builds would mostly measure the builds.
+        print("Benchmarks are skipped when installing several versions at once.")
+        options = options._replace(benchmark=False)
+    names = {v: build_variant(v, options).install_name(v) for v in versions}
+    mb_per_job = build_variant(versions[0], options).mb_per_job if versions else MB_PER_BUILD_JOB
+    installed = {v.name for v in scan_installed_versions(env) if has_interpreter(v.name, env)}
+    to_build = [v for v in versions if names[v] not in installed]
+    # Run as many builds at once as there are cores, as long as each of them
+    # can still afford at least one compiler process.
+    available = available_memory_mb()
+    limits = [len(to_build) or 1, usable_cpu_count()]
+    if available is not None:
+        limits.append(int((available - MB_RESERVED) // mb_per_job))
+    concurrency = max(1, min(limits))
+    share = 1.0 / concurrency
+    print(
+        f"\nInstalling {len(versions)} version(s); {len(to_build)} need building, "
+        f"{concurrency} at a time."
+    )
+
+    base_dir = tempfile.mkdtemp(prefix="python-env-setup-builds-")
+    graph = StepGraph()
+    results: Dict[str, Optional[str]] = {}
+
+    def make_action(version: str):
+        def action(values: dict) -> None:
+            build_dir = os.path.join(base_dir, version)
+            os.makedirs(build_dir, exist_ok=True)
+            results[version] = ensure_version_installed(
+                version,
+                env,
+                label=version,
+                build_dir=build_dir,
+                cpu_share=share,
+                memory_share=share,
+                options=options,
+            )
+            if not results[version]:
+                # python-build leaves its log in the build's TMPDIR; a failed
+                # tmpfs build has moved it back here.
+                logs = sorted(Path(build_dir).glob("python-build.*.log"))
+                if logs:
+                    raise StepFailed(f"Build directory kept for inspection: {build_dir} (log: {logs[-1].name})")
+                shutil.rmtree(build_dir, ignore_errors=True)
+                raise StepFailed("No python-build log was written here; see the messages above.")
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+        return action
+
+    for version in versions:
+        graph.add(f"install {version}", make_action(version))
+    graph.run(max_workers=concurrency)
+    try:
+        os.rmdir(base_dir)  # only succeeds if every build cleaned up after itself
+    except OSError:
+        pass
+
+    print("\nBatch install results:")
+    for version in versions:
+        step = graph.steps[f"install {version}"]
+        if names[version] in installed:
+            outcome = "already installed"
+        elif results.get(version):
+            outcome = "installed"
+        else:
+            outcome = "FAILED"
+        print(f"  {names[version]:<16} {outcome:<18} {step.duration:8.1f}s")
+    return {v: results.get(v) for v in versions}
+
+
+def set_global_version(version: str, env: dict) -> None:
+    try:
+        run_cmd(["pyenv", "global", version], check=True, env=env)
+        print(
+            f"Global pyenv version set to {version}. New shells will use this version "
+            "(unless overridden by a local version)."
+        )
+    except subprocess.CalledProcessError as e:
+        print("Failed to set global pyenv version:", e)
+
+
+def ask_set_global_version(version: str) -> bool:
+    return ask_yes_no(
         f"Do you want to set Python {version} as your *global* default pyenv version?",
         default=False,
-    ):
-        try:
-            run_cmd(["pyenv", "global", version], check=True, env=env)
-            print(
-                f"Global pyenv version set to {version}. New shells will use this version "
-                "(unless overridden by a local version)."
-            )
-        except subprocess.CalledProcessError as e:
-            print("Failed to set global pyenv version:", e)
+    )
 
 
 # ------------------------ demo project with pyenv-virtualenv ------------------------
 
 
-def create_demo_virtualenv(version: str, env: dict) -> None:
+@traced
+def create_demo_virtualenv(version: str, env: dict, *, precompile: Optional[str] = None) -> None:
     print("\nSetting up a demo project using pyenv-virtualenv...")
 
     # Check if pyenv-virtualenv is available
@@ -513,8 +3962,11 @@ def create_demo_virtualenv(version: str, env: dict) -> None:
         return
 
     home = Path.home()
-    demo_dir = home / "pyenv_virtualenv_demo"
-    env_name = "demo-env"
+    free_threaded = is_free_threaded(version)
+    # Keep a free-threaded demo apart from the regular one, which may already
+    # exist for a GIL build.
+    demo_dir = home / ("pyenv_virtualenv_demo_ft" if free_threaded else "pyenv_virtualenv_demo")
+    env_name = "demo-env-ft" if free_threaded else "demo-env"
 
     demo_dir.mkdir(parents=True, exist_ok=True)
 
@@ -522,11 +3974,7 @@ def create_demo_virtualenv(version: str, env: dict) -> None:
     print(f"Virtualenv name: {env_name}")
 
     # Create virtualenv if it doesn't exist yet
-    try:
-        out = run_cmd(["pyenv", "virtualenvs", "--bare"], capture_output=True, check=True, env=env)
-        existing_envs = {line.strip() for line in out.splitlines() if line.strip()}
-    except subprocess.CalledProcessError:
-        existing_envs = set()
+    existing_envs = {v.name for v in scan_installed_versions(env) if v.is_virtualenv}
 
     full_env_name = env_name
     if full_env_name in existing_envs:
@@ -539,6 +3987,18 @@ def create_demo_virtualenv(version: str, env: dict) -> None:
             print("Failed to create virtualenv via pyenv-virtualenv:", e)
             return
 
+    if free_threaded:
+        if gil_enabled(interpreter_path(env_name, env), env) is False:
+            print(f"Virtualenv '{env_name}' runs without the GIL.")
+        else:
+            print(
+                f"Warning: virtualenv '{env_name}' does not run without the GIL; "
+                f"it may have been created from a different Python than {version}."
+            )
+
+    if precompile:
+        precompile_bytecode(env_name, env, mode=precompile, include_stdlib=False)
+
     # Make this demo directory use the demo-env by default
     try:
         run_cmd(["pyenv", "local", env_name], check=True, env=env, cwd=str(demo_dir))
@@ -554,7 +4014,11 @@ def create_demo_virtualenv(version: str, env: dict) -> None:
         "\nNow demonstrating how activation works in a *subshell* (your current shell "
         "will not be modified):\n"
     )
-    demo_cmd = f"cd '{demo_dir}' && pyenv activate {env_name} && echo 'Inside demo-env:' && python -V && which python && pyenv deactivate"
+    gil_cmd = " && python -c 'import sys; print(\"GIL enabled:\", sys._is_gil_enabled())'" if free_threaded else ""
+    demo_cmd = (
+        f"cd '{demo_dir}' && pyenv activate {env_name} && echo 'Inside {env_name}:' && python -V"
+        f"{gil_cmd} && which python && pyenv deactivate"
+    )
     try:
         run_cmd(["bash", "-lc", demo_cmd], check=True, env=env)
     except Exception as e:  # noqa: BLE001
@@ -623,7 +4087,299 @@ def print_windows_wsl_instructions() -> None:
 # ------------------------ main entry point ------------------------
 
 
-def main() -> int:
+def add_list_versions_step(graph: StepGraph, env: dict) -> None:
+    """Add the "list-versions" step; it only needs pyenv itself."""
+
+    def list_versions(values: dict) -> dict:
+        return {"versions": list_available_versions(env)}
+
+    graph.add("list-versions", list_versions, inputs=["pyenv"], outputs=["versions"])
+
+
+def resolve_listed_version(spec: str, values: dict) -> str:
+    """Resolve spec against the "versions" step output, failing the step if nothing matches."""
+
+    version = resolve_version_spec(spec, values["versions"] or [])
+    if not version:
+        raise StepFailed(f"No available CPython version matches '{spec}'.")
+    return version
+
+
+def add_batch_install_steps(
+    graph: StepGraph, env: dict, specs: List[str], options: Optional[BuildOptions] = None
+) -> None:
+    """Add steps for --install: resolve every spec, then build them concurrently."""
+
+    def install_batch(values: dict) -> None:
+        versions: List[str] = []
+        for spec in specs:
+            version = resolve_listed_version(spec, values)
+            if version not in versions:
+                versions.append(version)
+        results = install_versions_concurrently(versions, env, options)
+        if not all(results.values()):
+            raise StepFailed("Some versions could not be installed.")
+
+    add_list_versions_step(graph, env)
+    graph.add("install-batch", install_batch, inputs=["versions", "build-deps"])
+
+
+def add_build_matrix_steps(graph: StepGraph, env: dict, spec: str, options: Optional[BuildOptions] = None) -> None:
+    """Add steps for --build-matrix: resolve spec, then build and benchmark it every way."""
+
+    def build_matrix(values: dict) -> None:
+        version = resolve_listed_version(spec, values)
+        if run_build_matrix(version, env, options) is None:
+            raise StepFailed()
+
+    add_list_versions_step(graph, env)
+    graph.add("build-matrix", build_matrix, inputs=["versions", "build-deps"])
+
+
+def add_version_steps(
+    graph: StepGraph,
+    env: dict,
+    *,
+    version_spec: Optional[str] = None,
+    options: Optional[BuildOptions] = None,
+) -> None:
+    """Add the version listing / selection / install / virtualenv steps.
+
+    Needs "pyenv", "build-deps" and "pyenv-virtualenv" to be produced or
+    provided. Listing versions only needs pyenv itself, so it overlaps with the
+    apt install on a fresh machine.
+    """
+
+    def select_version(values: dict) -> dict:
+        # All follow-up questions are asked here, so nothing interrupts the
+        # long-running install afterwards.
+        if version_spec:
+            version = resolve_listed_version(version_spec, values)
+            print(f"Selected Python {version} (from --python {version_spec}).")
+        else:
+            version = prompt_for_version(env, values["versions"] or [])
+            if not version:
+                raise StepFailed()
+        set_global = ask_set_global_version(version)
+        demo = ask_yes_no("Create a demo project using pyenv-virtualenv?", default=True)
+        return {"version": version, "set-global": set_global, "demo": demo}
+
+    def install_version(values: dict) -> dict:
+        name = ensure_version_installed(values["version"], env, options=options)
+        if not name:
+            raise StepFailed()
+        return {"python": name}
+
+    def set_global(values: dict) -> None:
+        if values["set-global"]:
+            set_global_version(values["python"], env)
+
+    def demo_virtualenv(values: dict) -> None:
+        if values["demo"]:
+            create_demo_virtualenv(values["python"], env, precompile=options.precompile if options else None)
+        else:
+            print("Skipping demo virtualenv creation.")
+
+    add_list_versions_step(graph, env)
+    graph.add(
+        "select-version",
+        select_version,
+        inputs=["versions"],
+        outputs=["version", "set-global", "demo"],
+        interactive=True,
+    )
+    graph.add("install-version", install_version, inputs=["version", "build-deps"], outputs=["python"])
+    graph.add("set-global", set_global, inputs=["python", "set-global"])
+    graph.add("demo-virtualenv", demo_virtualenv, inputs=["python", "demo", "pyenv-virtualenv"])
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Interactive helper to install a newer Python with pyenv and pyenv-virtualenv."
+    )
+    parser.add_argument(
+        "--python",
+        metavar="SPEC",
+        help="version to install instead of choosing from the menu: an exact "
+        "version (3.12.4), a minor version (3.12) for its newest patch release, or 'latest'",
+    )
+    parser.add_argument(
+        "--install",
+        nargs="+",
+        metavar="SPEC",
+        help="non-interactively install several versions concurrently "
+        "(e.g. --install 3.10 3.11 3.12 3.13); each SPEC is resolved like --python",
+    )
+    parser.add_argument(
+        "--no-binary-cache",
+        action="store_true",
+        help="always compile from source; don't restore or store builds in the binary cache",
+    )
+    parser.add_argument(
+        "--no-ccache",
+        action="store_true",
+        help="don't compile through ccache even if it is installed",
+    )
+    parser.add_argument(
+        "--ccache-size",
+        default="5G",
+        metavar="SIZE",
+        help="size limit of the persistent ccache directory (default: 5G)",
+    )
+    parser.add_argument(
+        "--optimized",
+        action="store_true",
+        help="build with profile-guided optimization and link-time optimization "
+        "(--enable-optimizations --with-lto), installed as <version>-opt",
+    )
+    parser.add_argument(
+        "--pgo-workload",
+        metavar="SCRIPT",
+        help="train the --optimized build on SCRIPT instead of CPython's test suite; "
+        "implies --optimized and installs as <version>-opt-<script name>",
+    )
+    parser.add_argument(
+        "--jit",
+        action="store_true",
+        help="build with CPython's experimental JIT (3.13+, needs LLVM), installed as <version>-jit",
+    )
+    parser.add_argument(
+        "--bolt",
+        action="store_true",
+        help="optimize the PGO+LTO build further with BOLT (3.12+, needs llvm-bolt and merge-fdata), "
+        "installed as <version>-opt-bolt and compared with <version>-opt",
+    )
+    parser.add_argument(
+        "--frame-pointers",
+        action="store_true",
+        help="keep frame pointers for perf profiling (-fno-omit-frame-pointer), installed as "
+        "<version>-fp; checks -X perf and measures the throughput cost",
+    )
+    parser.add_argument(
+        "--dtrace",
+        action="store_true",
+        help="build with DTrace/SystemTap USDT probes (--with-dtrace), installed as <version>-dtrace; "
+        "checks the probes and measures their cost while idle",
+    )
+    parser.add_argument(
+        "--slim",
+        action="store_true",
+        help="leave out the test suite, IDLE and Tk (--disable-test-modules, no tkinter), "
+        "installed as <version>-slim; reports the build time and disk space saved",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="after installing, strip binaries and remove test suites and libpython*.a, "
+        "recording what was removed in a manifest inside the version's directory",
+    )
+    parser.add_argument(
+        "--precompile",
+        nargs="?",
+        const="timestamp",
+        choices=INVALIDATION_MODES,
+        metavar="MODE",
+        help="after installing, compile the stdlib and site-packages to .pyc in parallel; MODE is "
+        "timestamp (default), checked-hash or unchecked-hash (fastest, for read-only deployments)",
+    )
+    parser.add_argument(
+        "--no-tmpfs",
+        action="store_true",
+        help="always build on disk, even when there is enough memory to build in /dev/shm",
+    )
+    parser.add_argument(
+        "--native",
+        action="store_true",
+        help="tune the build for this machine's CPU (-march=native -mtune=native), installed as "
+        "<version>-native-<cpu>; the result may crash with SIGILL on other CPUs",
+    )
+    parser.add_argument(
+        "--build-matrix",
+        metavar="SPEC",
+        help="build SPEC in several configurations (default, PGO, PGO+LTO, clang, "
+        "-fno-semantic-interposition), benchmark them and save the fastest as this host's default",
+    )
+    parser.add_argument(
+        "--no-host-default",
+        action="store_true",
+        help="ignore the configuration --build-matrix saved for this host",
+    )
+    parser.add_argument(
+        "--no-benchmark",
+        action="store_true",
+        help="skip the benchmark that compares special builds with a default build",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="OUT.json",
+        help="write a timeline of every step and command in Chrome trace-event "
+        "format (open it in chrome://tracing or https://ui.perfetto.dev)",
+    )
+    args = parser.parse_args(argv)
+    if args.pgo_workload:
+        try:
+            pgo_workload_info(args.pgo_workload)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
+
+def build_options_from_args(args: argparse.Namespace, env: Optional[dict] = None) -> BuildOptions:
+    options = BuildOptions(
+        binary_cache=not args.no_binary_cache,
+        ccache=not args.no_ccache,
+        ccache_size=args.ccache_size,
+        benchmark=not args.no_benchmark,
+        optimized=args.optimized,
+        pgo_workload=str(Path(args.pgo_workload).expanduser().resolve()) if args.pgo_workload else None,
+        jit=args.jit,
+        native=args.native,
+        bolt=args.bolt,
+        frame_pointers=args.frame_pointers,
+        dtrace=args.dtrace,
+        slim=args.slim,
+        prune=args.prune,
+        precompile=args.precompile,
+        tmpfs=not args.no_tmpfs,
+    )
+    explicit_variant = any(getattr(options, k) != v for k, v in DEFAULT_VARIANT_OPTIONS.items())
+    if not (explicit_variant or args.build_matrix or args.no_host_default):
+        host_default = load_host_default()
+        problems: List[str] = []
+        if host_default and host_default["config"] != "default":
+            # The toolchain the winner was built with (e.g. clang and its LLVM tools) may be gone since.
+            version = str(host_default.get("version") or "3.12.0")
+            config_options = options._replace(config=host_default["config"])
+            problems = check_build_toolchain(version, build_variant(version, config_options), env or os.environ)
+        if problems:
+            print(
+                f"Warning: this host's fastest build configuration, {host_default['config']}, can't be built "
+                f"any more ({'; '.join(problems)}); using the default build."
+            )
+        elif host_default and host_default["config"] != "default":
+            print(
+                f"Using this host's fastest build configuration, {host_default['config']} "
+                "(chosen by --build-matrix; --no-host-default to skip)."
+            )
+            # The configuration was picked by benchmarking already.
+            options = options._replace(config=host_default["config"], benchmark=False)
+    return options
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        return run_setup(args)
+    finally:
+        if args.trace:
+            try:
+                TRACER.write_chrome_trace(args.trace)
+                print(f"Trace written to {args.trace}")
+            except OSError as e:
+                print(f"Could not write trace to {args.trace}: {e}")
+
+
+def run_setup(args: argparse.Namespace) -> int:
     print_banner()
 
     env_name = detect_environment()
@@ -647,28 +4403,53 @@ def main() -> int:
     elif env_name == "wsl_ubuntu":
         print("Detected Ubuntu running under Windows Subsystem for Linux (WSL).")
 
-    env = ensure_pyenv_and_virtualenv(env_name, raw_env)
-
-    if not command_exists("pyenv", env):
-        # Already printed guidance inside ensure_pyenv_and_virtualenv
+    env = ensure_pyenv_in_env(raw_env)
+    options = build_options_from_args(args, env)
+    graph = StepGraph()
+    if env_name in {"ubuntu", "wsl_ubuntu"} and not command_exists("pyenv", env):
+        # Bootstrap pyenv inside the same graph so that apt and the clones can
+        # overlap with listing and selecting a version.
+        env = install_pyenv_ubuntu_like(
+            env, is_wsl=(env_name == "wsl_ubuntu"), graph=graph, packages=ubuntu_build_deps(options)
+        )
+        if not graph.produces("pyenv"):
+            print("pyenv still not found in PATH. Please install/configure it manually and re-run this script.")
+            return 1
+    else:
+        env = ensure_pyenv_and_virtualenv(env_name, env, packages=ubuntu_build_deps(options))
+        if not command_exists("pyenv", env):
+            # Already printed guidance inside ensure_pyenv_and_virtualenv
+            return 1
+        graph.provide("pyenv", "build-deps", "pyenv-virtualenv")
+
+    if args.build_matrix:
+        add_build_matrix_steps(graph, env, args.build_matrix, options)
+        graph.run()
+        graph.print_report()
+        return 0 if graph.steps["build-matrix"].status == "done" else 1
+
+    if args.install:
+        add_batch_install_steps(graph, env, args.install, options)
+        graph.run()
+        graph.print_report()
+        return 0 if graph.steps["install-batch"].status == "done" else 1
+
+    add_version_steps(graph, env, version_spec=args.python, options=options)
+    graph.run()
+    graph.print_report()
+
+    select_status = graph.steps["select-version"].status
+    if select_status == "skipped":
+        # pyenv itself could not be set up; the failing step printed why.
         return 1
-
-    version = prompt_for_version(env)
-    if not version:
+    if select_status != "done":
         print("No version selected. Exiting.")
         return 0
 
-    if not ensure_version_installed(version, env):
+    if not graph.values.get("python"):
         print("Could not install the requested Python version. Exiting.")
         return 1
 
-    maybe_set_global_version(version, env)
-
-    if ask_yes_no("Create a demo project using pyenv-virtualenv?", default=True):
-        create_demo_virtualenv(version, env)
-    else:
-        print("Skipping demo virtualenv creation.")
-
     print("\nAll done. You can re-run this script at any time to install other versions.")
     return 0
 
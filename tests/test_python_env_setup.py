@@ -0,0 +1,343 @@
+"""Unit tests for the pure helpers in python_env_setup.py.
+
+Run with:
+  python3 -m unittest discover -s tests
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import python_env_setup as setup  # noqa: E402
+
+
+SHA_XZ = "a" * 64
+SHA_TGZ = "b" * 64
+
+DEFINITIONS = {
+    # The shape of current definitions: .tar.xz first, .tgz as the fallback.
+    "3.12.4": (
+        'prefer_openssl3\n'
+        'install_package "openssl-3.2.2" "https://www.openssl.org/source/openssl-3.2.2.tar.gz#' + "c" * 64 + '" '
+        "mac_openssl --if has_broken_mac_openssl\n"
+        "if has_tar_xz_support; then\n"
+        '    install_package "Python-3.12.4" "https://www.python.org/ftp/python/3.12.4/Python-3.12.4.tar.xz#'
+        + SHA_XZ.upper() + '" standard verify_py312 ensurepip\n'
+        "else\n"
+        '    install_package "Python-3.12.4" "https://www.python.org/ftp/python/3.12.4/Python-3.12.4.tgz#'
+        + SHA_TGZ + '" standard verify_py312 ensurepip\n'
+        "fi\n"
+    ),
+    # Older definitions choose the tarball in shell and pass "$src".
+    "3.4.10": (
+        "has_tar_xz_support \\\n"
+        '  && src="https://www.python.org/ftp/python/3.4.10/Python-3.4.10.tar.xz#' + SHA_XZ + '" \\\n'
+        '  || src="https://www.python.org/ftp/python/3.4.10/Python-3.4.10.tgz#' + SHA_TGZ + '"\n'
+        'install_package "Python-3.4.10" "$src" standard verify_py34 ensurepip\n'
+    ),
+    # Free-threaded definitions set a flag and source the regular one.
+    "3.12.4t": 'export PYTHON_BUILD_FREE_THREADING=1\nsource "$(dirname "${BASH_SOURCE[0]}")"/3.12.4\n',
+    "3.13.0t": 'export PYTHON_BUILD_FREE_THREADING=1\nsource "$(dirname "${BASH_SOURCE[0]}")"/3.13.0t\n',
+    "3.11.0": 'install_package "Python-3.11.0" "https://www.python.org/ftp/python/3.11.0/Python-3.11.0.tar.xz"\n',
+    "3.10.0": "echo not a python package\n",
+}
+
+
+class ParseDefinitionTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+        for name, text in DEFINITIONS.items():
+            (self.dir / name).write_text(text, encoding="utf-8")
+
+    def parse(self, name):
+        return setup.parse_definition(str(self.dir / name), name)
+
+    def test_prefers_tar_xz_and_lowercases_sha(self):
+        entry = self.parse("3.12.4")
+        self.assertEqual(entry.url, "https://www.python.org/ftp/python/3.12.4/Python-3.12.4.tar.xz")
+        self.assertEqual(entry.sha256, SHA_XZ)
+        self.assertEqual(entry.definition, str(self.dir / "3.12.4"))
+
+    def test_follows_src_variable(self):
+        entry = self.parse("3.4.10")
+        self.assertEqual(entry.url, "https://www.python.org/ftp/python/3.4.10/Python-3.4.10.tar.xz")
+        self.assertEqual(entry.sha256, SHA_XZ)
+
+    def test_free_threaded_sources_regular_definition(self):
+        entry = self.parse("3.12.4t")
+        self.assertEqual(entry.version, "3.12.4t")
+        self.assertEqual(entry.url, "https://www.python.org/ftp/python/3.12.4/Python-3.12.4.tar.xz")
+        self.assertEqual(entry.definition, str(self.dir / "3.12.4t"))
+
+    def test_self_source_does_not_recurse(self):
+        self.assertEqual(self.parse("3.13.0t"), setup.CatalogEntry("3.13.0t", None, None, str(self.dir / "3.13.0t")))
+
+    def test_missing_checksum_or_package(self):
+        self.assertIsNone(self.parse("3.11.0").sha256)
+        self.assertIsNone(self.parse("3.10.0").url)
+        self.assertIsNone(setup.parse_definition(str(self.dir / "3.99.0"), "3.99.0"))
+
+    def test_catalog_skips_non_cpython_and_sorts(self):
+        (self.dir / "pypy3.10-7.3.15").write_text("install_package x y\n", encoding="utf-8")
+        catalog = setup.build_version_catalog(str(self.dir))
+        self.assertEqual(list(catalog), ["3.4.10", "3.10.0", "3.11.0", "3.12.4", "3.12.4t", "3.13.0t"])
+
+
+class StepGraphTest(unittest.TestCase):
+    def test_runs_in_dependency_order_and_passes_values(self):
+        graph = setup.StepGraph()
+        graph.add("b", lambda values: {"y": values["x"] + 1}, inputs=["x"], outputs=["y"])
+        graph.add("a", lambda values: {"x": 1}, outputs=["x"])
+        self.assertTrue(graph.run())
+        self.assertEqual(graph.values["y"], 2)
+        self.assertEqual([s.name for s in graph.topological_order()], ["a", "b"])
+
+    def test_failure_skips_dependents_only(self):
+        def fail(values):
+            raise setup.StepFailed("no pyenv")
+
+        graph = setup.StepGraph()
+        graph.add("install", fail, outputs=["pyenv"])
+        graph.add("use", lambda values: None, inputs=["pyenv"], outputs=["version"])
+        graph.add("after", lambda values: None, inputs=["version"])
+        graph.add("other", lambda values: None)
+        with mock.patch.object(setup, "emit_line"):
+            self.assertFalse(graph.run())
+        statuses = {name: step.status for name, step in graph.steps.items()}
+        self.assertEqual(statuses, {"install": "failed", "use": "skipped", "after": "skipped", "other": "done"})
+
+    def test_provided_inputs_need_no_producer(self):
+        graph = setup.StepGraph()
+        graph.provide("pyenv", value="/usr/bin/pyenv")
+        graph.add("use", lambda values: {"seen": values["pyenv"]}, inputs=["pyenv"], outputs=["seen"])
+        self.assertTrue(graph.run())
+        self.assertEqual(graph.values["seen"], "/usr/bin/pyenv")
+
+    def test_cycle_is_rejected(self):
+        graph = setup.StepGraph()
+        graph.add("a", lambda values: None, inputs=["b"], outputs=["a"])
+        graph.add("b", lambda values: None, inputs=["a"], outputs=["b"])
+        with self.assertRaisesRegex(ValueError, "cycle"):
+            graph.run()
+
+    def test_unknown_dependency_is_rejected(self):
+        graph = setup.StepGraph()
+        graph.add("a", lambda values: None, inputs=["missing"])
+        with self.assertRaisesRegex(ValueError, "no step produces"):
+            graph.run()
+
+    def test_duplicate_output_is_rejected(self):
+        graph = setup.StepGraph()
+        graph.add("a", lambda values: None, outputs=["x"])
+        with self.assertRaises(ValueError):
+            graph.add("b", lambda values: None, outputs=["x"])
+
+    def test_critical_path_follows_longest_chain(self):
+        graph = setup.StepGraph()
+        timings = {"apt": (0, 5), "clone": (0, 1), "pyenv": (5, 6), "install": (6, 20), "demo": (1, 2)}
+        graph.add("apt", None, outputs=["deps"])
+        graph.add("clone", None, outputs=["src"])
+        graph.add("pyenv", None, inputs=["deps", "src"], outputs=["pyenv"])
+        graph.add("install", None, inputs=["pyenv"])
+        graph.add("demo", None, inputs=["src"])
+        for name, (started, finished) in timings.items():
+            graph.steps[name].started, graph.steps[name].finished = started, finished
+        self.assertEqual([s.name for s in graph.critical_path()], ["apt", "pyenv", "install"])
+
+    def test_critical_path_skips_steps_that_never_ran(self):
+        graph = setup.StepGraph()
+        graph.add("a", None, outputs=["x"])
+        graph.add("b", None, inputs=["x"])
+        self.assertEqual(graph.critical_path(), [])
+
+
+class ListVersionsStepTest(unittest.TestCase):
+    def test_resolves_specs_or_fails_the_step(self):
+        def pick(values):
+            return {"picked": setup.resolve_listed_version("3.12", values)}
+
+        graph = setup.StepGraph()
+        graph.provide("pyenv")
+        setup.add_list_versions_step(graph, {})
+        graph.add("pick", pick, inputs=["versions"], outputs=["picked"])
+        graph.add("missing", lambda values: setup.resolve_listed_version("2.7", values), inputs=["versions"])
+        listed = ["3.11.9", "3.12.3", "3.12.4"]
+        with mock.patch.object(setup, "list_available_versions", lambda env: listed):
+            with mock.patch.object(setup, "emit_line") as emit:
+                self.assertFalse(graph.run())
+        self.assertEqual(graph.values["picked"], "3.12.4")
+        self.assertEqual(graph.steps["missing"].status, "failed")
+        emit.assert_called_with("No available CPython version matches '2.7'.", "missing")
+
+
+class WithMakeJobsTest(unittest.TestCase):
+    def test_replaces_attached_forms(self):
+        self.assertEqual(setup.with_make_jobs("-j8 V=1", 3), "V=1 -j3")
+        self.assertEqual(setup.with_make_jobs("--jobs=4 -k", 3), "-k -j3")
+
+    def test_replaces_separate_forms(self):
+        # python-build's own default is "-j <cores>".
+        self.assertEqual(setup.with_make_jobs("-j 8", 3), "-j3")
+        self.assertEqual(setup.with_make_jobs("--jobs 7 -k", 3), "-k -j3")
+
+    def test_bare_j_keeps_following_option(self):
+        self.assertEqual(setup.with_make_jobs("-k -j -s", 3), "-k -s -j3")
+
+    def test_empty(self):
+        self.assertEqual(setup.with_make_jobs("", 2), "-j2")
+
+
+class PlanBuildJobsTest(unittest.TestCase):
+    def plan(self, *, cpus=8, memory_mb=None, history=(), **kwargs):
+        with mock.patch.multiple(
+            setup,
+            usable_cpu_count=lambda: cpus,
+            cgroup_cpu_limit=lambda: None,
+            available_memory_mb=lambda: memory_mb,
+            load_build_history=lambda: list(history),
+            host_signature=lambda: "host",
+        ):
+            return setup.plan_build_jobs("3.12.4", **kwargs)
+
+    def test_unknown_memory_uses_all_cores(self):
+        plan = self.plan(cpus=8, memory_mb=None)
+        self.assertEqual(plan.jobs, 8)
+        self.assertIsNone(plan.memory_limit)
+
+    def test_memory_caps_jobs(self):
+        plan = self.plan(cpus=8, memory_mb=setup.MB_RESERVED + 3 * setup.MB_PER_BUILD_JOB)
+        self.assertEqual(plan.jobs, 3)
+        self.assertEqual(plan.memory_limit, 3)
+
+    @staticmethod
+    def record(jobs, seconds, **extra):
+        return dict(host="host", version="3.12.1", jobs=jobs, seconds=seconds, **extra)
+
+    def test_untried_ceiling_first(self):
+        self.assertEqual(self.plan(cpus=8, history=[self.record(6, 100)]).jobs, 8)
+
+    def test_steps_down_from_measured_ceiling(self):
+        self.assertEqual(self.plan(cpus=8, history=[self.record(8, 100)]).jobs, 6)
+
+    def test_keeps_stepping_while_faster(self):
+        history = [self.record(8, 100), self.record(6, 90)]
+        self.assertEqual(self.plan(cpus=8, history=history).jobs, 5)
+
+    def test_settles_on_fastest(self):
+        history = [self.record(8, 100), self.record(6, 110)]
+        self.assertEqual(self.plan(cpus=8, history=history).jobs, 8)
+
+    def test_ignores_builds_that_downloaded(self):
+        history = [self.record(8, 100, downloaded=True)]
+        self.assertEqual(self.plan(cpus=8, history=history).jobs, 8)
+
+    def test_avoids_memory_bound_job_counts(self):
+        history = [self.record(8, 100, memory_bound=True)]
+        self.assertEqual(self.plan(cpus=8, history=history).jobs, 7)
+
+    def test_other_profiles_ignored(self):
+        history = [self.record(8, 100, profile="pgo-lto")]
+        self.assertEqual(self.plan(cpus=8, history=history).jobs, 8)
+
+
+def sample(**fields):
+    values = dict(
+        t=0.0, cpu_cores=1.0, rss_mb=100.0, mem_available_mb=4000.0, mem_total_mb=8000.0,
+        swap_used_mb=0.0, iowait_pct=0.0, io_read_mb=0.0, io_write_mb=0.0,
+    )
+    values.update(fields)
+    return setup.ProcSample(**values)
+
+
+class ClassifyLoadTest(unittest.TestCase):
+    def test_cpu_bound(self):
+        self.assertEqual(setup.classify_load([sample(cpu_cores=4.0)] * 3, 4), "CPU-bound")
+
+    def test_cgroup_limit_counts_as_memory_bound(self):
+        # A 2 GB container on a big host: 60 MB left below its limit.
+        samples = [sample(mem_total_mb=2048.0, mem_available_mb=60.0, cpu_cores=4.0)] * 3
+        self.assertEqual(setup.classify_load(samples, 4), "memory-bound")
+
+    def test_swap_growth_is_memory_bound(self):
+        samples = [sample(swap_used_mb=0.0), sample(swap_used_mb=500.0)]
+        self.assertEqual(setup.classify_load(samples, 4), "memory-bound")
+
+
+class CgroupMemoryTest(unittest.TestCase):
+    def read(self, files):
+        return mock.patch.object(setup, "_read_proc", lambda path: files.get(path, ""))
+
+    def test_v2_limit_and_usage(self):
+        mb = 1024 * 1024
+        files = {"/sys/fs/cgroup/memory.max": f"{2048 * mb}\n", "/sys/fs/cgroup/memory.current": f"{512 * mb}\n"}
+        with self.read(files):
+            self.assertEqual(setup.cgroup_memory_mb(), (512.0, 2048.0))
+
+    def test_unlimited(self):
+        with self.read({"/sys/fs/cgroup/memory.max": "max\n"}):
+            self.assertIsNone(setup.cgroup_memory_mb())
+        with self.read({"/sys/fs/cgroup/memory/memory.limit_in_bytes": str(1 << 62)}):
+            self.assertIsNone(setup.cgroup_memory_mb())
+
+    def test_oom_kills(self):
+        events = "low 0\nhigh 0\nmax 12\noom 3\noom_kill 2\n"
+        with self.read({"/sys/fs/cgroup/memory.events": events}):
+            self.assertEqual(setup.cgroup_oom_kills(), 2)
+        with self.read({"/sys/fs/cgroup/memory/memory.oom_control": "oom_kill_disable 0\nunder_oom 0\noom_kill 5\n"}):
+            self.assertEqual(setup.cgroup_oom_kills(), 5)
+        with self.read({}):
+            self.assertIsNone(setup.cgroup_oom_kills())
+
+
+class CcacheStatsTest(unittest.TestCase):
+    def test_stats_log(self):
+        log = "# 2024-06-01T10:00:00\ndirect_cache_hit\n# x\ncache_miss\npreprocessed_cache_hit\n\n"
+        self.assertEqual(setup._parse_ccache_stats_log(log), {"hits": 2, "misses": 1})
+
+    def test_print_stats(self):
+        text = "direct_cache_hit\t10\npreprocessed_cache_hit\t5\ncache_miss\t3\n"
+        self.assertEqual(setup._parse_ccache_stats(text), {"hits": 15, "misses": 3})
+
+    def test_ccache_3_summary(self):
+        text = "cache hit (direct)                  7\ncache hit (preprocessed)   1\ncache miss      2\n"
+        self.assertEqual(setup._parse_ccache_stats(text), {"hits": 8, "misses": 2})
+
+
+class VersionIndexResolveTest(unittest.TestCase):
+    def setUp(self):
+        self.index = setup.VersionIndex(
+            ["3.11.9", "3.12.3", "3.12.4", "3.13.0", "3.13.1", "3.13.1t", "3.9.19", "not-a-version"]
+        )
+
+    def test_latest(self):
+        self.assertEqual(self.index.resolve("latest"), "3.13.1")
+        self.assertEqual(self.index.resolve("latest-3.12"), "3.12.4")
+
+    def test_prefixes(self):
+        self.assertEqual(self.index.resolve("3"), "3.13.1")
+        self.assertEqual(self.index.resolve("3.12"), "3.12.4")
+        self.assertEqual(self.index.resolve(" 3.9 "), "3.9.19")
+
+    def test_exact(self):
+        self.assertEqual(self.index.resolve("3.12.3"), "3.12.3")
+        self.assertIsNone(self.index.resolve("3.12.9"))
+
+    def test_free_threaded(self):
+        self.assertEqual(self.index.resolve("3.13t"), "3.13.1t")
+        self.assertEqual(self.index.resolve("3.13.1t"), "3.13.1t")
+        self.assertIsNone(self.index.resolve("3.12t"))
+
+    def test_unknown(self):
+        self.assertIsNone(self.index.resolve("3.10"))
+        self.assertIsNone(self.index.resolve("pypy3.10"))
+        self.assertEqual(len(self.index), 7)
+
+
+if __name__ == "__main__":
+    unittest.main()